@@ -5,8 +5,16 @@
 # license: MIT
 # version: 1.0
 import pyxel as px
+import base64
 import json
-import copy
+import math
+import os
+import random
+import sys
+import threading
+import zlib
+from array import array
+from functools import lru_cache
 
 IS_WEB = True
 
@@ -15,18 +23,101 @@ try:
 except:
     IS_WEB = False
 
+BIG_ENDIAN = sys.byteorder == "big"  # データパックはリトルエンディアン
+
 # 呪文インデックス定数
 SPELL_FIRE = 0
 SPELL_RETURN = 1
 SPELL_HEAL = 2
 SPELL_BURST = 3
 
+# 地形コード
+TERRAIN_FLOOR = 0
+TERRAIN_WALL = 1
+TERRAIN_FOUNTAIN = 2
+TERRAIN_UP = 3
+TERRAIN_DOWN = 4
+
+# タイル座標 → 地形コード
+TERRAIN_TILES = {
+    (0, 2): TERRAIN_WALL,
+    (2, 2): TERRAIN_FOUNTAIN,
+    (4, 0): TERRAIN_UP,
+    (6, 0): TERRAIN_DOWN,
+}
+# 地形コード → イベント文字（壁、泉、上り階段、下り階段）
+TERRAIN_EVENTS = ("", "-", "@", "<", ">")
+
+FLOORS = 5  # ダンジョンの階数（タイルマップ0〜4）
+
+# 自動移動の行き先（表示名、地形コードまたは障害物のキー）
+DESTINATIONS = (
+    ("のぼる", TERRAIN_UP),
+    ("くだる", TERRAIN_DOWN),
+    ("いずみ", TERRAIN_FOUNTAIN),
+    ("みせ", "0-3"),
+)
+# エンカウント（最後の戦闘から12歩は出ない。その後は1歩ごとに1/8）
+ENCOUNTER_STEPS = 12
+ENCOUNTER_RATE = 1 / 8
+# 乱数の系統（系統ごとに別の乱数列を使う）
+RNG_STREAMS = ("encounter", "turn", "hit", "damage", "flee", "gold")
+# 戦闘の結果（battle_end に渡す）
+BATTLE_WIN = 1
+BATTLE_LOSE = 2
+BATTLE_FLED = 3
+UNREACHABLE = 0xFFFF  # 距離表でたどり着けないマス
+# 早送り（1回の描画あたりの update の回数。F2キーかXボタンで切り替え）
+TURBO_SPEEDS = (1, 2, 4)
+AUTO_BATTLE_TICKS = 20  # バトルの自動送り（F3キーかYボタン）でAボタンを押す間隔
+
+# ボタンのビット
+BTN_UP = 1
+BTN_DOWN = 2
+BTN_LEFT = 4
+BTN_RIGHT = 8
+BTN_A = 16
+BTN_B = 32
+BTN_A_PRESS = 64  # Aを押した瞬間だけ（BTN_A と違って押しっぱなしの連射なし）
+BTN_TURBO = 128  # 早送りで同じフレームの2回目以降の update（ゲーム時間を数えない）
+BTN_DIRS = BTN_UP | BTN_DOWN | BTN_LEFT | BTN_RIGHT
+
+SAVE_FILE = "save.dat"  # セーブファイル（SaveData のバイナリ形式）
+SAVE_FILE_JSON = "save.json"  # 旧形式のセーブファイル（読み込み時に変換する）
+SAVE_KEY = "pyxel-tiny-drpg"  # web 版のセーブ先（localStorage のキー）
+FONT_FILE = "k8x12S.bdf"  # フォントファイル
+FONT_SUBSET_FILE = "k8x12S-subset.bdf"  # 使う文字だけ（tools/build_font.py で作成）
 BDF = None
+GFX = None  # 描画先（PyxelGfx など。set_gfx で切り替える）
+AUTOSAVE = True  # 階を移動したら自動でセーブする
+
+
+# 描画先: pyxel（画面と画像への描画は GFX を通す。pyxel の関数をそのまま持つ）
+class PyxelGfx:
+    def __init__(self):
+        self.image = px.Image
+        self.cls = px.cls
+        self.blt = px.blt
+        self.bltm = px.bltm
+        self.rect = px.rect
+        self.text = px.text
+        self.line = px.line
+
+
+# 描画先の切り替え（前の描画先で作った画像は使えないので、文字とウィンドウの画像を捨てる）
+def set_gfx(gfx):
+    global GFX
+    GFX = gfx
+    text_image.cache_clear()
+    for win in list(Window.all.values()) + list(Window.pool.values()):
+        win.img = None
+        win.drawn = None
 
 
 # ウィンドウオブジェクト
 class Window:
     all = {}
+    pool = {}  # 閉じたウィンドウ（同じキーで開くときに再利用）
 
     def __init__(self, key, x1, y1, x2, y2, texts):
         self.key = key
@@ -35,74 +126,86 @@ class Window:
         self.x2 = x2
         self.y2 = y2
         self.texts = texts
+        self.img = None  # 枠とテキストを描画済みの画像
+        self.drawn = None  # 画像に描画済みの座標とテキスト
 
     def draw(self):
-        x1 = self.x1 * 8
-        y1 = self.y1 * 8
-        x2 = self.x2 * 8
-        y2 = self.y2 * 8
-        px.blt(x1, y1, 0, 0, 48, 8, 8)
-        px.blt(x2 - 8, y1, 0, 8, 48, 8, 8)
-        px.blt(x1, y2 - 8, 0, 0, 56, 8, 8)
-        px.blt(x2 - 8, y2 - 8, 0, 8, 56, 8, 8)
-        x = self.x1 + 1
-        while x < self.x2 - 1:
-            px.blt(x * 8, y1, 0, 16, 48, 8, 8)
-            px.blt(x * 8, y2 - 8, 0, 16, 56, 8, 8)
-            x += 1
-        y = self.y1 + 1
-        while y < self.y2 - 1:
-            px.blt(x1, y * 8, 0, 24, 48, 8, 8)
-            px.blt(x2 - 8, y * 8, 0, 24, 56, 8, 8)
-            y += 1
-        px.rect(x1 + 8, y1 + 8, x2 - x1 - 16, y2 - y1 - 16, 0)
+        state = (self.x1, self.y1, self.x2, self.y2, tuple(self.texts))
+        if state != self.drawn:
+            self.render()
+            self.drawn = state
+        img = self.img
+        GFX.blt(self.x1 * 8, self.y1 * 8, img, 0, 0, img.width, img.height)
+
+    # 枠とテキストをオフスクリーン画像に描画（内容が変わったときだけ呼ばれる）
+    def render(self):
+        w = (self.x2 - self.x1) * 8
+        h = (self.y2 - self.y1) * 8
+        if self.img is None or (self.img.width, self.img.height) != (w, h):
+            self.img = GFX.image(w, h)
+        img = self.img
+        img.blt(0, 0, 0, 0, 48, 8, 8)
+        img.blt(w - 8, 0, 0, 8, 48, 8, 8)
+        img.blt(0, h - 8, 0, 0, 56, 8, 8)
+        img.blt(w - 8, h - 8, 0, 8, 56, 8, 8)
+        for x in range(8, w - 8, 8):
+            img.blt(x, 0, 0, 16, 48, 8, 8)
+            img.blt(x, h - 8, 0, 16, 56, 8, 8)
+        for y in range(8, h - 8, 8):
+            img.blt(0, y, 0, 24, 48, 8, 8)
+            img.blt(w - 8, y, 0, 24, 56, 8, 8)
+        img.rect(8, 8, w - 16, h - 16, 0)
         for pos, text in enumerate(self.texts):
             if pos >= 0 and pos < (self.y2 - self.y1 - 2) // 2:
-                draw_text(self.x1 + 1, self.y1 + 1 + pos * 2, text)
+                draw_text(1, 1 + pos * 2, text, img)
 
     @classmethod
     def open(cls, key, x1, y1, x2, y2, texts=[]):
         if key in cls.all:
             cls.all[key].texts = texts
+        elif key in cls.pool:
+            win = cls.all[key] = cls.pool.pop(key)
+            win.x1, win.y1, win.x2, win.y2 = (x1, y1, x2, y2)
+            win.texts = texts
         else:
             cls.all[key] = cls(key, x1, y1, x2, y2, texts)
         return cls.all[key]
 
     @classmethod
     def close(cls):
-        windows_copy = copy.deepcopy(cls.all)
-        for key in windows_copy:
-            del cls.all[key]
-        return
+        cls.pool.update(cls.all)
+        cls.all.clear()
 
 
 # カーソル（選択肢の ▶︎）
 class Cursor:
-    def __init__(self, key, list_x, y, cancel_pos=None):
+    # y: 選択肢の行（選択肢ごとに行が違うときはリスト）
+    def __init__(self, key, list_x, y, cancel_pos=None, decide=BTN_A):
         self.key = key
         self.list_x = list_x
-        self.y = y
+        self.list_y = y if isinstance(y, list) else [y] * len(list_x)
         self.pos = 0
         self.cancel_pos = cancel_pos
+        self.decide = decide  # 決定のボタン（BTN_A_PRESS なら押しっぱなしの連射では決定しない）
         self.moved = False
 
     def draw(self):
         x = self.list_x[self.pos]
-        px.blt(x * 8, self.y * 8, 0, 32, 48, 8, 8)
+        GFX.blt(x * 8, self.list_y[self.pos] * 8, 0, 32, 48, 8, 8)
 
     def update(self, btn):
-        if btn["r"] or btn["l"]:
+        if btn & (BTN_LEFT | BTN_RIGHT):
             if self.moved:
                 return
-            dist = 1 if btn["r"] else -1
+            dist = 1 if btn & BTN_RIGHT else -1
             self.pos = (self.pos + dist) % len(self.list_x)
             self.moved = True
         else:
             self.moved = False
-        if btn["a"]:
+        if btn & self.decide:
             px.play(3, 35)
             return self.pos
-        elif btn["b"]:
+        elif btn & BTN_B:
             return self.cancel_pos
         return None
 
@@ -116,17 +219,282 @@ class Obstacle:
         self.kind = kind
         self.val = val
 
+
+# 障害物テーブル（列ごとの配列で保持し、階ごとにまとめる）
+class ObstacleTable:
+    # cols: データパックの obstacles 表（列名 → 配列）
+    def __init__(self, cols={}):
+        self.keys = list(cols.get("key", ()))
+        self.rows = {key: i for i, key in enumerate(self.keys)}  # キー → 行番号
+        self.x = cols.get("x", array("h"))
+        self.y = cols.get("y", array("h"))
+        self.z = cols.get("z", array("h"))
+        self.kind = cols.get("kind", array("b"))
+        self.val = cols.get("val", array("i"))
+        # 1:表示中 0:フラグ済み（開いた扉、取った宝箱など）
+        self.alive = bytearray(b"\1" * len(self.keys))
+        self.version = 0  # 表示中の障害物が変わるたびに増える（描き直しの判定用）
+        self.floors = {}  # 階 → 行番号リスト
+        self.at = {}  # (x, y, z) → 行番号（表示中のもののみ）
+        for i, z in enumerate(self.z):
+            self.floors.setdefault(z, []).append(i)
+            self.at[(self.x[i], self.y[i], z)] = i
+        # 同じキー・同じ位置の障害物があればエラー（rows と at は1件ずつしか持てない）
+        if len(self.rows) < len(self.keys) or len(self.at) < len(self.keys):
+            self.find_duplicate()
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # 会話・イベント処理用に1件分をオブジェクトで取り出す
+    def __getitem__(self, key):
+        i = self.rows[key]
+        return Obstacle(self.x[i], self.y[i], self.z[i], self.kind[i], self.val[i])
+
+    # 同じキー・同じ位置の障害物は追加できない（rows と at は1件ずつしか持てない）
+    def add(self, key, x, y, z, kind=0, val=0):
+        if key in self.rows:
+            raise ValueError(f"duplicate obstacle key {key!r}")
+        for j in self.floors.get(z, []):
+            if self.x[j] == x and self.y[j] == y:
+                raise ValueError(
+                    f"obstacles {self.keys[j]!r} and {key!r} at the same position"
+                )
+        i = len(self.keys)
+        self.keys.append(key)
+        self.rows[key] = i
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+        self.kind.append(kind)
+        self.val.append(val)
+        self.alive.append(1)
+        self.floors.setdefault(z, []).append(i)
+        self.at[(x, y, z)] = i
+        self.version += 1
+
+    # 重複しているキーまたは位置を探してエラーにする
+    def find_duplicate(self):
+        rows = {}
+        at = {}
+        for i, key in enumerate(self.keys):
+            pos = (self.x[i], self.y[i], self.z[i])
+            if key in rows:
+                raise ValueError(f"duplicate obstacle key {key!r}")
+            if pos in at:
+                raise ValueError(
+                    f"obstacles {self.keys[at[pos]]!r} and {key!r} at the same position"
+                )
+            rows[key] = at[pos] = i
+
+    # 位置から表示中の障害物のキーを取得
+    def key_at(self, x, y, z):
+        i = self.at.get((x, y, z))
+        return "" if i is None else self.keys[i]
+
+    # フラグが立った障害物を消す
+    def remove(self, key):
+        i = self.rows[key]
+        if self.alive[i]:
+            self.alive[i] = 0
+            del self.at[(self.x[i], self.y[i], self.z[i])]
+            self.version += 1
+
+    # フラグの状態から表示中の障害物を作り直す
+    def reset(self, flags):
+        self.at = {}
+        for i, key in enumerate(self.keys):
+            self.alive[i] = not key in flags
+            if self.alive[i]:
+                self.at[(self.x[i], self.y[i], self.z[i])] = i
+        self.version += 1
+
+    # 画面内（中心から±64ドット未満）の障害物だけを描画
     def draw(self, pl_x, pl_y, pl_z):
-        ox = self.x * 16 - pl_x
-        oy = self.y * 16 - pl_y
-        if abs(ox) < 64 and abs(oy) < 64 and abs(self.z == pl_z):
-            if self.kind == 0:
-                u, v = 2, 1
-            elif self.kind == 1:
-                u, v = 3, 1
-            else:
-                u, v = 2 + (px.frame_count % 30) // 15, 2
-            px.blt(56 + ox, 48 + oy, 0, u * 16, v * 16, 16, 16, 1)
+        frame = 2 + (px.frame_count % 30) // 15
+        at = self.at
+        for y in range((pl_y - 64) // 16 + 1, (pl_y + 63) // 16 + 1):
+            for x in range((pl_x - 64) // 16 + 1, (pl_x + 63) // 16 + 1):
+                i = at.get((x, y, pl_z))
+                if i is None:
+                    continue
+                kind = self.kind[i]
+                if kind == 0:
+                    u, v = 2, 1
+                elif kind == 1:
+                    u, v = 3, 1
+                else:
+                    u, v = frame, 2
+                ox = x * 16 - pl_x
+                oy = y * 16 - pl_y
+                GFX.blt(56 + ox, 48 + oy, 0, u * 16, v * 16, 16, 16, 1)
+
+
+# オートマップ（階ごとの踏破済みマスのビット列と、その階の縮小地図の画像）
+# 地図の画像は新しく見えたマスを1マスずつ塗り足すだけで、描き直さない
+class Automap:
+    SCALE = 3  # 1マスのドット数
+    COLORS = (1, 13, 12, 10, 10)  # 地形コード → 色（床、壁、泉、上り階段、下り階段）
+
+    def __init__(self, terrain):
+        self.terrain = terrain
+        size = terrain.width * terrain.height
+        self.visited = [bytearray((size + 7) // 8) for _ in terrain.grids]
+        w, h = (terrain.width * self.SCALE, terrain.height * self.SCALE)
+        self.images = [GFX.image(w, h) for _ in terrain.grids]
+
+    # ニューゲーム・ロード時にまっさらにする
+    def reset(self):
+        for bits in self.visited:
+            bits[:] = bytes(len(bits))
+        for img in self.images:
+            img.cls(0)
+
+    # (x, y) とまわり8マスを踏破済みにし、新しく見えたマスを地図に塗る
+    def reveal(self, x, y, z):
+        terrain = self.terrain
+        bits = self.visited[z]
+        for cy in range(max(y - 1, 0), min(y + 2, terrain.height)):
+            for cx in range(max(x - 1, 0), min(x + 2, terrain.width)):
+                i = cy * terrain.width + cx
+                if bits[i >> 3] >> (i & 7) & 1:
+                    continue
+                bits[i >> 3] |= 1 << (i & 7)
+                self.paint(i, z)
+
+    # マス i を地図の画像に塗る
+    def paint(self, i, z):
+        s = self.SCALE
+        y, x = divmod(i, self.terrain.width)
+        color = self.COLORS[self.terrain.grids[z][i]]
+        self.images[z].rect(x * s, y * s, s, s, color)
+
+    def __contains__(self, pos):
+        x, y, z = pos
+        i = y * self.terrain.width + x
+        return self.visited[z][i >> 3] >> (i & 7) & 1 == 1
+
+    # セーブ用のバイト列（全階のビット列をつないで圧縮したもの）
+    def dumps(self):
+        return zlib.compress(b"".join(self.visited), 9)
+
+    # セーブデータから戻して地図を塗り直す（階の大きさが違う、壊れているならまっさら）
+    def loads(self, data):
+        self.reset()
+        try:
+            data = zlib.decompress(data)
+        except zlib.error:
+            return
+        size = len(self.visited[0])
+        if len(data) != size * len(self.visited):
+            return
+        for z, bits in enumerate(self.visited):
+            bits[:] = data[z * size : (z + 1) * size]
+            for i in range(self.terrain.width * self.terrain.height):
+                if bits[i >> 3] >> (i & 7) & 1:
+                    self.paint(i, z)
+
+    # 地図を画面に描く（(x, y) が中央に来るように、画像の外は出さない）
+    def draw(self, x, y, z, blink):
+        img = self.images[z]
+        s = self.SCALE
+        u = min(max(x * s + s // 2 - 64, 0), img.width - 128)
+        v = min(max(y * s + s // 2 - 56, 0), img.height - 112)
+        GFX.blt(0, 0, img, u, v, 128, 112)
+        if blink:
+            GFX.rect(x * s - u, y * s - v, s, s, 8)
+
+
+# フラグ（宝箱、扉などの判定用）。フラグ名をIDに変換し、ビット列で管理する
+class Flags:
+    ids = {}  # フラグ名 → ID（全インスタンス共通）
+    names = []  # ID → フラグ名
+
+    def __init__(self, names=()):
+        self.bits = bytearray()
+        for name in names:
+            self.add(name)
+
+    def __contains__(self, name):
+        i = self.ids.get(name)
+        if i is None or i >> 3 >= len(self.bits):
+            return False
+        return self.bits[i >> 3] >> (i & 7) & 1 == 1
+
+    def add(self, name):
+        i = self.intern(name)
+        if i >> 3 >= len(self.bits):
+            self.bits.extend(bytes((i >> 3) + 1 - len(self.bits)))
+        self.bits[i >> 3] |= 1 << (i & 7)
+
+    # セーブ用のフラグ名リスト
+    def to_list(self):
+        return [name for name in self.names if name in self]
+
+    @classmethod
+    def intern(cls, name):
+        i = cls.ids.get(name)
+        if i is None:
+            i = cls.ids[name] = len(cls.names)
+            cls.names.append(name)
+        return i
+
+
+# 地形グリッド（階ごとに1マス1バイトの地形コード。1マスはタイル2×2）
+class Terrain:
+    def __init__(self, width, height, grids):
+        self.width = width
+        self.height = height
+        self.grids = grids
+
+    def get(self, x, y, z):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.grids[z][y * self.width + x]
+        return TERRAIN_WALL
+
+    # Pyxelのタイルマップから変換（起動時に1回だけ）
+    @classmethod
+    def from_tilemaps(cls, tilemaps, floors=FLOORS):
+        width = tilemaps[0].width // 2
+        height = tilemaps[0].height // 2
+        grids = []
+        for z in range(floors):
+            tm = tilemaps[z]
+            grid = bytearray(width * height)
+            for y in range(height):
+                for x in range(width):
+                    grid[y * width + x] = TERRAIN_TILES.get(tm.pget(x * 2, y * 2), 0)
+            grids.append(grid)
+        return cls(width, height, grids)
+
+    # リソースファイルから直接変換（Pyxelの初期化なしで使える）
+    @classmethod
+    def from_resource(cls, filename, floors=FLOORS):
+        import tomllib
+        import zipfile
+
+        with zipfile.ZipFile(filename) as zf:
+            res = tomllib.loads(zf.read("pyxel_resource.toml").decode())
+        width = res["tilemaps"][0]["width"] // 2
+        height = res["tilemaps"][0]["height"] // 2
+        grids = []
+        for z in range(floors):
+            rows = res["tilemaps"][z]["data"]  # 行ごとに u, v を並べたもの（末尾の0は省略）
+            grid = bytearray(width * height)
+            for y in range(min(height, (len(rows) + 1) // 2)):
+                row = rows[y * 2]
+                for x in range(min(width, (len(row) + 3) // 4)):
+                    u = row[x * 4]
+                    v = row[x * 4 + 1] if x * 4 + 1 < len(row) else 0
+                    grid[y * width + x] = TERRAIN_TILES.get((u, v), 0)
+            grids.append(grid)
+        return cls(width, height, grids)
 
 
 # 戦闘用キャラクタ（自分とモンスター）
@@ -161,39 +529,262 @@ class Spell:
         return self.mp
 
 
+### ゲームデータ ###
+
+CONTENT_FILE = "content.json"  # 障害物、会話、モンスター、呪文のデータ
+CONTENT_PACK = "content.bin"  # ↑をまとめたもの（tools/build_content.py で作成）
+
+# データパックの表と列（列名, 型）。型は array の型コード、"s" は文字列
+# 文字列のリスト（会話、呪文の説明）は改行でつないで1つの文字列にする
+PACK_TABLES = {
+    "obstacles": (
+        ("key", "s"),
+        ("x", "h"),
+        ("y", "h"),
+        ("z", "h"),
+        ("kind", "b"),
+        ("val", "i"),
+    ),
+    "talks": (("key", "s"), ("lines", "s")),
+    "monsters": (
+        ("name", "s"),
+        ("hp", "i"),
+        ("mp", "i"),
+        ("atk", "i"),
+        ("spd", "i"),
+        ("resist", "b"),
+        ("img", "b"),
+        ("gold", "i"),
+    ),
+    "spells": (("name", "s"), ("mp", "i"), ("on_menu", "b"), ("desc", "s")),
+}
+
+
+# 文字列の列（UTF-8 を1つにつないだバイト列と開始位置の配列。取り出すときにデコード）
+class StrColumn:
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].decode()
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    @classmethod
+    def from_list(cls, strings):
+        offsets = array("I", [0])
+        blob = bytearray()
+        for s in strings:
+            blob += s.encode()
+            offsets.append(len(blob))
+        return cls(offsets, bytes(blob))
+
+
+# データパック（表ごとに列を丸ごと並べたバイナリ。1回の読み込みで全部を取り出す）
+# 形式: ヘッダ "TDPK" 版数(2) 表数(2)、表ごとに 名前長(2) 列数(2) 行数(4) 名前、
+# 列ごとに 名前長(2) 型(1) データ長(4) 名前 データ（文字列は開始位置配列 + 本体）
+# 数値はすべてリトルエンディアン
+class Pack:
+    MAGIC = b"TDPK"
+    VERSION = 1
+
+    # JSON のデータ（表名 → 行のリスト）から列を作る
+    @staticmethod
+    def from_rows(data):
+        tables = {}
+        for name, columns in PACK_TABLES.items():
+            rows = data.get(name, [])
+            cols = {}
+            for col, typ in columns:
+                values = [row[col] for row in rows]
+                if typ == "s":
+                    values = [v if type(v) is str else "\n".join(v) for v in values]
+                    cols[col] = StrColumn.from_list(values)
+                else:
+                    cols[col] = array(typ, values)
+            tables[name] = cols
+        return tables
+
+    @classmethod
+    def dumps(cls, tables):
+        out = [cls.MAGIC, le(array("H", [cls.VERSION, len(tables)]))]
+        for name, cols in tables.items():
+            n = len(next(iter(cols.values()), ()))
+            out += [le(array("H", [len(name), len(cols)])), le(array("I", [n]))]
+            out.append(name.encode())
+            for col, data in cols.items():
+                if isinstance(data, StrColumn):
+                    typ, body = "s", le(data.offsets) + data.blob
+                else:
+                    typ, body = data.typecode, le(data)
+                out.append(le(array("H", [len(col)])) + typ.encode())
+                out += [le(array("I", [len(body)])), col.encode(), body]
+        return b"".join(out)
+
+    @classmethod
+    def loads(cls, data):
+        data = memoryview(data)
+        if bytes(data[:4]) != cls.MAGIC:
+            raise ValueError("not a data pack")
+        version, count = from_le("H", data[4:8])
+        if version != cls.VERSION:
+            raise ValueError(f"unsupported data pack version {version}")
+        pos = 8
+        tables = {}
+        for _ in range(count):
+            name_len, col_count = from_le("H", data[pos : pos + 4])
+            (n,) = from_le("I", data[pos + 4 : pos + 8])
+            pos += 8
+            name = bytes(data[pos : pos + name_len]).decode()
+            pos += name_len
+            cols = {}
+            for _ in range(col_count):
+                (col_len,) = from_le("H", data[pos : pos + 2])
+                typ = chr(data[pos + 2])
+                (size,) = from_le("I", data[pos + 3 : pos + 7])
+                pos += 7
+                col = bytes(data[pos : pos + col_len]).decode()
+                pos += col_len
+                body = data[pos : pos + size]
+                pos += size
+                if typ == "s":
+                    offsets = from_le("I", body[: (n + 1) * 4])
+                    cols[col] = StrColumn(offsets, bytes(body[(n + 1) * 4 :]))
+                else:
+                    cols[col] = from_le(typ, body)
+            tables[name] = cols
+        return tables
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename, "rb") as f:
+            return cls.loads(f.read())
+
+
+# 配列 ⇔ リトルエンディアンのバイト列
+def le(values):
+    if BIG_ENDIAN:
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_le(typ, data):
+    values = array(typ)
+    values.frombytes(data)
+    if BIG_ENDIAN:
+        values.byteswap()
+    return values
+
+
+# データパックの表（列のまま持ち、1件分は取り出すときに組み立てる）
+class Table:
+    def __init__(self, cols):
+        self.cols = cols
+
+    def __len__(self):
+        return len(next(iter(self.cols.values())))
+
+    def row(self, i):
+        return [col[i] for col in self.cols.values()]
+
+
+# モンスター（1件分は Actor の引数の並び）
+class MonsterTable(Table):
+    def __getitem__(self, i):
+        return self.row(i)
+
+
+# 呪文
+class SpellTable(Table):
+    def __getitem__(self, i):
+        name, mp, on_menu, desc = self.row(i)
+        return Spell(name, mp, bool(on_menu), desc.split("\n"))
+
+
+# 会話（障害物のキー → 行のリスト）
+class TalkTable(Table):
+    def __init__(self, cols):
+        super().__init__(cols)
+        self.rows = {key: i for i, key in enumerate(cols["key"])}
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __getitem__(self, key):
+        return self.cols["lines"][self.rows[key]].split("\n")
+
+
+# ゲームデータ一式（データパックがなければ JSON から作る）
+class Content:
+    def __init__(self, tables):
+        self.obstacles = ObstacleTable(tables["obstacles"])
+        self.talks = TalkTable(tables["talks"])
+        self.monsters = MonsterTable(tables["monsters"])
+        self.spells = SpellTable(tables["spells"])
+
+    @classmethod
+    def load(cls, pack=CONTENT_PACK, source=CONTENT_FILE):
+        if os.path.exists(pack):
+            return cls(Pack.read(pack))
+        with open(source, encoding="utf-8") as f:
+            return cls(Pack.from_rows(json.load(f)))
+
+
 ### ユーティリティ関数 ###
 
 
-# 全角化
+# 全角化テーブル
+H2Z = str.maketrans(
+    " 1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ /+-:*#()[]",
+    "　１２３４５６７８９０ａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ　／＋－：＊＃（）［］",
+)
+
+
+# 全角化（同じ値は変換結果を使い回す）
+@lru_cache(maxsize=1024, typed=True)
 def zen(val):
-    h2z = str.maketrans(
-        " 1234567890abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ /+-:*#()[]",
-        "　１２３４５６７８９０ａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺ　／＋－：＊＃（）［］",
-    )
-    return str(val).translate(h2z)
+    return str(val).translate(H2Z)
+
+
+# 文字列を描画済みの画像（背景は透明色0）。同じ文字列は画像を使い回す
+@lru_cache(maxsize=128)
+def text_image(s):
+    img = GFX.image(len(s) * 8, 16)
+    img.cls(0)
+    img.text(0, 0, s, 7, BDF)
+    return img
 
 
-# テキスト描画
-def draw_text(x, y, t):
-    px.text(x * 8, y * 8 + 4, zen(t), 7, BDF)
+# テキスト描画（img を指定するとその画像に描画）
+def draw_text(x, y, t, img=None):
+    s = zen(t)
+    if s:
+        g = text_image(s)
+        (GFX if img is None else img).blt(x * 8, y * 8 + 4, g, 0, 0, g.width, 16, 0)
 
 
-# セーブファイル名
-def get_data_file():
-    return px.user_data_dir("shiromofu factory", "tinyDRPG") + "save.json"
+# セーブファイル名（name で同じ場所の別ファイル）
+def get_data_file(name=SAVE_FILE):
+    return px.user_data_dir("shiromofu factory", "tinyDRPG") + name
 
 
-# ボタン取得
+# ボタン取得（押されているボタンのビットの和。入力ログにもこのまま記録する）
 def get_btn_state():
-    btn = {
-        "u": px.btn(px.KEY_UP) or px.btn(px.GAMEPAD1_BUTTON_DPAD_UP),
-        "d": px.btn(px.KEY_DOWN) or px.btn(px.GAMEPAD1_BUTTON_DPAD_DOWN),
-        "l": px.btn(px.KEY_LEFT) or px.btn(px.GAMEPAD1_BUTTON_DPAD_LEFT),
-        "r": px.btn(px.KEY_RIGHT) or px.btn(px.GAMEPAD1_BUTTON_DPAD_RIGHT),
-        "a": px.btnp(px.KEY_Z, 10, 2) or px.btnp(px.GAMEPAD1_BUTTON_A, 10, 2),
-        "b": px.btnp(px.KEY_X, 10, 2) or px.btnp(px.GAMEPAD1_BUTTON_B, 10, 2),
-    }
-    return btn
+    return (
+        (px.btn(px.KEY_UP) or px.btn(px.GAMEPAD1_BUTTON_DPAD_UP)) * BTN_UP
+        | (px.btn(px.KEY_DOWN) or px.btn(px.GAMEPAD1_BUTTON_DPAD_DOWN)) * BTN_DOWN
+        | (px.btn(px.KEY_LEFT) or px.btn(px.GAMEPAD1_BUTTON_DPAD_LEFT)) * BTN_LEFT
+        | (px.btn(px.KEY_RIGHT) or px.btn(px.GAMEPAD1_BUTTON_DPAD_RIGHT)) * BTN_RIGHT
+        | (px.btnp(px.KEY_Z, 10, 2) or px.btnp(px.GAMEPAD1_BUTTON_A, 10, 2)) * BTN_A
+        | (px.btnp(px.KEY_X, 10, 2) or px.btnp(px.GAMEPAD1_BUTTON_B, 10, 2)) * BTN_B
+        | (px.btnp(px.KEY_Z) or px.btnp(px.GAMEPAD1_BUTTON_A)) * BTN_A_PRESS
+    )
 
 
 # パディング左よせ
@@ -206,284 +797,508 @@ def pad(val, length, fill=" "):
     return zen(val).rjust(length, fill)[-length:]
 
 
+# セーブデータのバイナリ形式（save_dict と同じ項目の dict ⇔ バイト列）
+# MAGIC, バージョン(H), 本体の CRC32(I) のあとに本体:
+#   x y z (h) / HP 最大HP MP 最大MP ちから はやさ カギ お金 エンカウント (H) /
+#   プレイ時間(I) / 名前の長さ(B) と名前(UTF-8) / 立っているフラグの数(H) と
+#   フラグごとに名前の長さ(B) と名前（content.json の障害物の並びが変わっても同じ意味） /
+#   （省略可）オートマップの長さ(H) と Automap.dumps のバイト列（dict では base64 文字列）
+class SaveData:
+    MAGIC = b"TDSV"
+    VERSION = 1
+    POSITION = ("x", "y", "z")
+    STATS = ("hp", "mhp", "mp", "mmp", "atk", "spd", "keys", "gold", "enc")
+
+    @classmethod
+    def dumps(cls, data):
+        body = b"".join(
+            [
+                le(array("h", [data[key] for key in cls.POSITION])),
+                le(array("H", [data[key] for key in cls.STATS])),
+                le(array("I", [data["frames"]])),
+                cls.dump_str(data["name"]),
+                le(array("H", [len(data["flags"])])),
+            ]
+            + [cls.dump_str(name) for name in data["flags"]]
+        )
+        if "automap" in data:
+            automap = base64.b64decode(data["automap"])
+            body += le(array("H", [len(automap)])) + automap
+        head = le(array("H", [cls.VERSION])) + le(array("I", [zlib.crc32(body)]))
+        return cls.MAGIC + head + body
+
+    @classmethod
+    def loads(cls, data):
+        if data[:4] != cls.MAGIC:
+            raise ValueError("not a save data")
+        (version,) = from_le("H", data[4:6])
+        if version != cls.VERSION:
+            raise ValueError(f"unsupported save data version {version}")
+        body = data[10:]
+        if len(body) < 29 or from_le("I", data[6:10])[0] != zlib.crc32(body):
+            raise ValueError("broken save data")
+        ret = dict(zip(cls.POSITION, from_le("h", body[:6])))
+        ret.update(zip(cls.STATS, from_le("H", body[6:24])))
+        (ret["frames"],) = from_le("I", body[24:28])
+        ret["name"], pos = cls.load_str(body, 28)
+        if len(body) < pos + 2:
+            raise ValueError("broken save data")
+        (n,) = from_le("H", body[pos : pos + 2])
+        pos += 2
+        ret["flags"] = []
+        for _ in range(n):
+            name, pos = cls.load_str(body, pos)
+            ret["flags"].append(name)
+        if pos < len(body):
+            (n,) = from_le("H", body[pos : pos + 2])
+            if len(body) != pos + 2 + n:
+                raise ValueError("broken save data")
+            ret["automap"] = base64.b64encode(body[pos + 2 :]).decode()
+        return ret
+
+    # 長さ(B) つきの文字列
+    @staticmethod
+    def dump_str(s):
+        data = s.encode()
+        return bytes([len(data)]) + data
+
+    # pos から長さ(B) つきの文字列を読み、文字列と次の位置を返す
+    @staticmethod
+    def load_str(data, pos):
+        end = pos + 1 + (data[pos] if pos < len(data) else 0)
+        if end > len(data):
+            raise ValueError("broken save data")
+        return data[pos + 1 : end].decode(), end
+
+    # 旧形式（JSON）のセーブデータから
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        try:
+            ret = {key: int(data[key]) for key in cls.POSITION + cls.STATS}
+            ret["frames"] = int(data["frames"])
+            ret["name"] = str(data["name"])
+            ret["flags"] = [str(name) for name in data["flags"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"broken save data: {e!r}")
+        return ret
+
+
+# セーブファイル書き込み（別スレッドで書く。連続したセーブは最後の1回だけ書く）
+class SaveWriter:
+    def __init__(self, filename):
+        self.filename = filename
+        self.pending = None  # まだ書いていないセーブデータ
+        self.writing = False
+        self.error = None  # 書き込みに失敗したときの例外（take_error で受け取る）
+        self.cond = threading.Condition()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def put(self, data):
+        with self.cond:
+            self.pending = data
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                data, self.pending = self.pending, None
+                self.writing = True
+            try:
+                self.write(data)
+            except OSError as e:
+                with self.cond:
+                    self.error = e
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+
+    # 一時ファイルに書いてから置き換える（書き込み途中で落ちても前のデータが残る）
+    def write(self, data):
+        tmp = self.filename + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
+
+    # 書き込み待ちがなくなるまで待つ
+    def flush(self, timeout=2.0):
+        with self.cond:
+            self.cond.wait_for(self.idle, timeout)
+
+    def idle(self):
+        return self.pending is None and not self.writing
+
+    def take_error(self):
+        with self.cond:
+            e, self.error = self.error, None
+        return e
+
+
+# 乱数列（一様乱数をまとめて作っておき、順に使う）
+class Rng:
+    BATCH = 256
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.buf = []
+        self.pos = 0
+
+    def next(self):
+        if self.pos >= len(self.buf):
+            rnd = self.random.random
+            self.buf = [rnd() for _ in range(self.BATCH)]
+            self.pos = 0
+        u = self.buf[self.pos]
+        self.pos += 1
+        return u
+
+    # a 以上 b 以下の整数（px.rndi と同じく両端を含む）
+    def rndi(self, a, b):
+        return a + int(self.next() * (b - a + 1))
+
+    def rndf(self, a, b):
+        return a + self.next() * (b - a)
+
+    # 確率 p で当たる試行を、初めて当たるまで繰り返した回数（1以上）
+    def geometric(self, p):
+        return int(math.log(1.0 - self.next()) / math.log(1.0 - p)) + 1
+
+
+# 系統ごとの乱数列（rng.encounter、rng.hit など。シードが同じなら同じ結果になる）
+class RngStreams:
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        self.value = random.getrandbits(31) if seed is None else seed
+        for name in RNG_STREAMS:
+            setattr(self, name, Rng(f"{self.value}:{name}"))
+
+
+# 選択肢（cur.key）・シーン（scene）ごとの処理の登録先
+CURSOR_HANDLERS = {}  # キー → 決定・キャンセルしたときの処理 f(app, ret)
+CURSOR_MOVED = {}  # キー → 左右キーでカーソルを動かしたときの処理 f(app)
+SCENE_HANDLERS = {}  # シーン → カーソルがないときの毎フレームの処理 f(app, btn)
+# ボスイベントの選択肢 → モンスター番号
+BOSS_MONSTERS = {"boss1": 5, "boss2": 6, "boss3": 7}
+
+
+# App のメソッドを処理として登録するデコレータ
+def handler(table, *keys):
+    def register(func):
+        for key in keys:
+            table[key] = func
+        return func
+
+    return register
+
+
 # Pyxel
 class App:
-    def __init__(self):
+    # seed: 乱数列のシード（入力の記録・再生で同じ乱数にするため。None なら毎回ちがう）
+    # gfx: 描画先（省略時は PyxelGfx）
+    def __init__(self, seed=None, gfx=None):
         global BDF
         px.init(
             128, 128, title="Pyxel Tiny DRPG", quit_key=px.KEY_NONE, display_scale=2
         )
+        set_gfx(gfx or PyxelGfx())
         px.load("assets.pyxres")
-        BDF = px.Font("k8x12S.bdf")  # フォントファイル
-        # 障害物（ドア、宝箱、NPC）データ
-        self.obstacles = {
-            "0-1": Obstacle(8, 19, 0, 2),
-            "0-2": Obstacle(3, 19, 0, 2),
-            "0-3": Obstacle(8, 28, 0, 2),
-            "0-4": Obstacle(12, 19, 0, 2),
-            "0-5": Obstacle(12, 28, 0, 2),
-            "0-6": Obstacle(11, 16, 0, 1),
-            "0-7": Obstacle(11, 17, 0, 1, 100),
-            "0-8": Obstacle(4, 25, 0, 0),
-            "0-9": Obstacle(5, 27, 0, 2),
-            "1-1": Obstacle(4, 6, 1, 0),  # ドア1（直行）
-            "1-2": Obstacle(27, 3, 1, 2),
-            "1-3": Obstacle(7, 21, 1, 1, 50),
-            "1-4": Obstacle(8, 12, 1, 1, 6),
-            "1-5": Obstacle(12, 12, 1, 1, 110),
-            "1-6": Obstacle(16, 24, 1, 1, 80),
-            "1-7": Obstacle(24, 10, 1, 1),  # カギ1
-            "1-8": Obstacle(13, 8, 1, 0),  # ドア2（宝部屋）
-            "1-9": Obstacle(8, 7, 1, 1, 100),
-            "1-10": Obstacle(11, 7, 1, 1, 100),
-            "1-11": Obstacle(8, 9, 1, 1, 100),
-            "1-12": Obstacle(11, 9, 1, 1, 100),
-            "2-1": Obstacle(17, 10, 2, 1, 170),
-            "2-2": Obstacle(17, 20, 2, 1, 73),
-            "2-3": Obstacle(21, 10, 2, 1, 25),
-            "2-4": Obstacle(21, 20, 2, 1, 256),
-            "2-5": Obstacle(21, 4, 2, 2),
-            "2-6": Obstacle(28, 28, 2, 1),  # カギ2
-            "2-7": Obstacle(23, 4, 2, 0),  # ドア3（ヒール）
-            "3-1": Obstacle(6, 22, 3, 2),
-            "3-2": Obstacle(4, 6, 3, 0),  # ドア4（直行）
-            "3-3": Obstacle(24, 12, 3, 1),  # カギ3
-            "3-4": Obstacle(25, 12, 3, 1, 1000),
-            "3-5": Obstacle(4, 10, 3, 0),  # ドア5
-            "4-1": Obstacle(16, 11, 4, 1),  # カギ4
-            "4-2": Obstacle(18, 25, 4, 1),  # カギ5
-            "4-3": Obstacle(4, 27, 4, 2),
-        }
-        # 会話イベントデータ
-        self.talks = {
-            "0-1": ["ちか5かいに ねむる", "ひほうを さがしてまいれ"],
-            "0-2": ["いずみのみずを のむと", "HPとMPが かいふくするぞ"],
-            "0-4": ["XキーかBボタンで", "メニューを ひらけるぞ"],
-            "0-5": ["とびらを あけるには", "カギが ひつようだ"],
-            "0-9": ["このさきには", "モンスターが でるぜ"],
-            "1-2": ["おまえには もう", "おしえることは ないよ"],
-            "2-5": ["まいった！"],
-            "3-1": ["チクショウ！"],
-        }
-        # モンスターデータ
-        self.monsters = (
-            ["かぼちゃ", 12, 0, 6, 12, 0, 0, 20],
-            ["こおに", 24, 0, 10, 13, 0, 1, 40],
-            ["おにび", 32, 2, 14, 18, 1, 2, 80],
-            ["ゆうれい", 40, 0, 17, 32, 0, 3, 160],
-            ["にんじゃ", 64, 0, 34, 28, 0, 4, 320],
-            ["まどうし", 120, 4, 8, 15, 0, 5, 0],
-            ["だてんし", 200, 0, 20, 27, 1, 6, 0],
-            ["めがみ", 400, 0, 99, 99, 0, 7, 0],
+        BDF = px.Font(
+            FONT_SUBSET_FILE if os.path.exists(FONT_SUBSET_FILE) else FONT_FILE
         )
-        # 呪文データ
-        self.spells = [
-            Spell(
-                "ファイア", 2, False, ["ちいさな ひのたまを", "てきにぶつけて ダメージ"]
-            ),
-            Spell("リターン", 6, True, ["スタートいちに", "テレポートする"]),
-            Spell("ヒール", 0, True, ["HPを かいふく", "かいふくしたぶんMPをつかう"]),
-            Spell(
-                "バースト",
-                0,
-                False,
-                ["すべての まりょくを", "てきにぶつけて だいダメージ"],
-            ),
-        ]
+        self.terrain = Terrain.from_tilemaps(px.tilemaps)
+        self.automap = Automap(self.terrain)
+        # 障害物（ドア、宝箱、NPC）、会話、モンスター、呪文のデータ
+        content = Content.load()
+        self.obstacles = content.obstacles
+        self.talks = content.talks
+        self.monsters = content.monsters
+        self.spells = content.spells
+        # フラグIDを障害物、呪文、エンディングの順で固定しておく
+        for key in list(self.obstacles) + ["sp1", "sp2", "sp3", "end"]:
+            Flags.intern(key)
         self.cur = None
+        self.drawn = None  # 前回描画した画面の状態
         self.wait = False
+        self.btn_prev = 0  # 前のフレームのボタン
+        self.turbo = 1  # 早送り（TURBO_SPEEDS のどれか）
+        self.auto_battle = False  # バトルの自動送り
+        self.auto_ticks = 0  # 自動送りで前にAボタンを押してからの回数
         self.bgm = None
+        self.saver = None  # セーブファイル書き込み（最初のセーブで作る）
+        self.save_error = False
+        self.rng = RngStreams(seed)  # 系統ごとの乱数列
         self.welcome_show()
-        px.run(self.update, self.draw)
-
-    # pyxel updateメイン
-    def update(self):
-        # ゲーム時間カウント
-        if self.scene != "welcome":
+        px.run(self.run_update, self.draw)
+
+    # 1フレームの更新（F2キーで早送り、F3キーで自動送りを切り替え）
+    # 早送り中は update を複数回進めて、描画は最後の1回だけ
+    def run_update(self):
+        if px.btnp(px.KEY_F2) or px.btnp(px.GAMEPAD1_BUTTON_X):
+            i = TURBO_SPEEDS.index(self.turbo)
+            self.turbo = TURBO_SPEEDS[(i + 1) % len(TURBO_SPEEDS)]
+        if px.btnp(px.KEY_F3) or px.btnp(px.GAMEPAD1_BUTTON_Y):
+            self.auto_battle = not self.auto_battle
+        for tick in range(self.turbo):
+            self.update(self.read_input(tick))
+
+    # pyxel updateメイン（btn を渡すとその入力で1フレーム進める）
+    def update(self, btn=None):
+        if btn is None:
+            btn = self.read_input()
+        self.pressed, self.btn_prev = btn & ~self.btn_prev, btn
+        # ゲーム時間カウント（早送りで同じフレームの2回目以降は数えない）
+        if self.scene != "welcome" and not btn & BTN_TURBO:
             self.frames += 1
-        btn = get_btn_state()
         # 十字キー押しっぱなし防止
-        if self.wait and (btn["u"] or btn["d"] or btn["r"] or btn["l"]):
+        if self.wait and btn & BTN_DIRS:
             return
         self.wait = False
         # カーソルがある場合カーソル処理を優先
         if self.cur:
-            cur = self.cur
-            ret = cur.update(btn)
-            # ショップの場合は左右キーを押したときにウィンドウを再表示
-            if btn["r"] or btn["l"]:
-                if cur.key == "spells":
-                    self.menu_spells()
-                elif cur.key == "shop":
-                    self.shop_show()
-                elif cur.key == "bt_spells":
-                    self.battle_spells()
-            # ABボタンを押してなければ終了
-            if ret is None:
-                return
-            # 起動画面の選択肢
-            if cur.key == "welcome":
-                self.cur = None
-                # ret == 1（Continue)の場合、すでにセーブデータをロードしているので何もしない
-                if ret == 0:  # New
-                    self.new_game()
-                elif ret == 2:  # Exit
-                    px.quit()
-                self.field_start()
-            # メニューの選択肢
-            elif cur.key == "menu":
-                self.cur = None
-                if ret == 0:  # セーブ
-                    self.save_data()
-                elif ret == 1:  # じゅもん
-                    self.menu_spells()
-                    return
-                elif ret == 2:
-                    Window.close()
-                    self.welcome_show()
-                    return
-                self.field_start()
-                if ret == 0:
-                    self.message(["セーブしました"])
-            # メニュー呪文の選択肢
-            elif cur.key == "spells":
-                if ret >= 0:
-                    spl_id = self.available_spells()[ret]
-                    spl = self.spells[spl_id]
-                    mp = spl.get_mp(self.pl)
-                    if mp and mp <= self.pl.mp and spl.on_menu:
-                        self.pl.mp -= mp
-                        if spl_id == SPELL_RETURN:
-                            Window.close()
-                            self.cur = None
-                            self.go_start_location()
-                            px.play(3, 36)
-                            return
-                        elif spl_id == SPELL_HEAL:
-                            self.use_heal(mp)
-                            self.menu_spells()
-                else:
-                    Window.close()
-                    self.menu_show()
-                    self.cur.pos = 1
-            # ショップの選択肢
-            elif cur.key == "shop":
-                if ret < 0:
+            key = self.cur.key
+            ret = self.cur.update(btn)
+            # 左右キーでウィンドウを再表示する選択肢（呪文、ショップ）
+            if btn & (BTN_LEFT | BTN_RIGHT) and key in CURSOR_MOVED:
+                self.dispatch(CURSOR_MOVED, key)
+            # ABボタンを押していれば選択肢ごとの処理
+            if ret is not None:
+                self.dispatch(CURSOR_HANDLERS, key, ret)
+        elif self.scene in SCENE_HANDLERS:
+            self.dispatch(SCENE_HANDLERS, self.scene, btn)
+
+    # 登録された処理を呼ぶ
+    def dispatch(self, handlers, key, *args):
+        handlers[key](self, *args)
+
+    ### 選択肢ごとの処理（ret はカーソル位置、キャンセル時は cancel_pos） ###
+
+    # 起動画面の選択肢
+    @handler(CURSOR_HANDLERS, "welcome")
+    def select_welcome(self, ret):
+        self.cur = None
+        # ret == 1（Continue)の場合、すでにセーブデータをロードしているので何もしない
+        if ret == 0:  # New
+            self.new_game()
+        elif ret == 2:  # Exit
+            self.quit()
+        self.field_start()
+
+    # メニューの選択肢
+    @handler(CURSOR_HANDLERS, "menu")
+    def select_menu(self, ret):
+        self.cur = None
+        if ret == 0:  # セーブ
+            self.save_data()
+        elif ret == 1:  # じゅもん
+            self.menu_spells()
+            return
+        elif ret == 2:
+            Window.close()
+            self.welcome_show()
+            return
+        elif ret == 3:  # ちず
+            self.automap_show()
+            return
+        self.field_start()
+        if ret == 0:
+            self.message(["セーブしました"])
+
+    # メニュー呪文の選択肢
+    @handler(CURSOR_HANDLERS, "spells")
+    def select_spells(self, ret):
+        if ret >= 0:
+            spl_id = self.available_spells()[ret]
+            spl = self.spells[spl_id]
+            mp = spl.get_mp(self.pl)
+            if mp and mp <= self.pl.mp and spl.on_menu:
+                self.pl.mp -= mp
+                if spl_id == SPELL_RETURN:
                     Window.close()
                     self.cur = None
-                else:
-                    _, _, cost = self.shop_get_item(ret)
-                    if cost == 0 or self.gold < cost:
-                        return
-                    self.gold -= cost
-                    if ret == 0:
-                        self.pl.mhp += 5
-                        self.pl.hp = self.pl.mhp
-                    elif ret == 1:
-                        self.pl.mmp += 2
-                        self.pl.mp = self.pl.mmp
-                    elif ret == 2:
-                        self.pl.atk += 2
-                    elif ret == 3:
-                        self.pl.spd += 2
-                    px.play(3, 32)
-                    self.shop_show()
-            # イベント（ボス戦1）の選択肢
-            elif cur.key == "boss1":
-                self.cur = None
-                Window.close()
-                if ret == 0:
-                    self.battle_start(5, "boss1")
-            # イベント（ボス戦2）の選択肢
-            elif cur.key == "boss2":
-                self.cur = None
-                Window.close()
-                if ret == 0:
-                    self.battle_start(6, "boss2")
-            # イベント（ボス戦3）の選択肢
-            elif cur.key == "boss3":
-                self.cur = None
+                    self.go_start_location()
+                    px.play(3, 36)
+                    return
+                elif spl_id == SPELL_HEAL:
+                    self.use_heal(mp)
+                    self.menu_spells()
+        else:
+            Window.close()
+            self.menu_show()
+            self.cur.pos = 1
+
+    # ショップの選択肢
+    @handler(CURSOR_HANDLERS, "shop")
+    def select_shop(self, ret):
+        if ret < 0:
+            Window.close()
+            self.cur = None
+            return
+        _, _, cost = self.shop_get_item(ret)
+        if cost == 0 or self.gold < cost:
+            return
+        self.gold -= cost
+        if ret == 0:
+            self.pl.mhp += 5
+            self.pl.hp = self.pl.mhp
+        elif ret == 1:
+            self.pl.mmp += 2
+            self.pl.mp = self.pl.mmp
+        elif ret == 2:
+            self.pl.atk += 2
+        elif ret == 3:
+            self.pl.spd += 2
+        px.play(3, 32)
+        self.shop_show()
+
+    # イベント（ボス戦1〜3）の選択肢
+    @handler(CURSOR_HANDLERS, "boss1", "boss2", "boss3")
+    def select_boss(self, ret):
+        key = self.cur.key
+        self.cur = None
+        Window.close()
+        if ret == 0:
+            self.battle_start(BOSS_MONSTERS[key], key)
+
+    # バトルのコマンド選択
+    @handler(CURSOR_HANDLERS, "bt_command")
+    def select_bt_command(self, ret):
+        self.cur = None
+        if ret == 0:
+            self.battle_attack()
+        elif ret == 1:
+            self.battle_spells()
+        elif ret == 2:
+            self.battle_event("run")
+            self.battle_run()
+
+    # 自動移動の行き先の選択肢
+    @handler(CURSOR_HANDLERS, "goto")
+    def select_goto(self, ret):
+        self.cur = None
+        Window.close()
+        if ret >= 0:
+            self.autowalk = self.goto_list[ret]
+
+    # バトル呪文の選択肢
+    @handler(CURSOR_HANDLERS, "bt_spells")
+    def select_bt_spells(self, ret):
+        if ret < 0:
+            self.battle_command()
+            self.cur.pos = 1
+            return
+        spl_id = self.available_spells(True)[ret]
+        spl = self.spells[spl_id]
+        mp = spl.get_mp(self.pl)
+        if mp and mp <= self.pl.mp:
+            self.pl.mp -= mp
+            self.cur = None
+            self.bt_msg = [f"{self.pl.name}は {spl.name}をとなえた"]
+            if spl_id == SPELL_FIRE:
+                dmg = 0 if self.ms.resist else self.rng.damage.rndi(24, 30)
+                self.battle_damage(self.ms, dmg)
+                self.battle_event("fire", dmg)
+            elif spl_id == SPELL_HEAL:
+                ret = self.use_heal(mp)
+                self.bt_msg += [f"{ret}HP かいふくした"]
+                self.battle_event("heal", ret)
+            elif spl_id == SPELL_BURST:
+                dmg = 0
+                for _ in range(mp):
+                    dmg += self.rng.damage.rndi(8, 12)
+                self.battle_damage(self.ms, dmg)
+                self.battle_event("burst", dmg)
+            self.battle_show()
+
+    ### シーンごとの処理（カーソルがないとき毎フレーム） ###
+
+    # フィールド
+    @handler(SCENE_HANDLERS, "field")
+    def update_field(self, btn):
+        # 移動実処理
+        if self.moving:
+            # 移動中に押されたボタンを覚えておく（十字キーは最後に押し始めたもの）
+            pressed = self.pressed & BTN_DIRS
+            if pressed:
+                self.buffered &= ~BTN_DIRS
+            self.buffered |= pressed | btn & (BTN_A | BTN_B | BTN_A_PRESS)
+            self.dy += self.spd * ((self.dy > 0) - (self.dy < 0))
+            self.dx += self.spd * ((self.dx > 0) - (self.dx < 0))
+            # 移動終了
+            if (self.dy % 16, self.dx % 16) == (0, 0):
+                self.move_end()
+            return
+        # 操作受付
+        if self.save_failed():
+            self.message(["セーブに しっぱいしました"])
+            return
+        # 移動中に押されたボタンを使う（十字キーは今押しているほうを優先）
+        if self.buffered:
+            if btn & BTN_DIRS:
+                self.buffered &= ~BTN_DIRS
+            btn |= self.buffered
+            self.buffered = 0
+        self.dy = bool(btn & BTN_DOWN) - bool(btn & BTN_UP)
+        self.dx = 0 if self.dy else bool(btn & BTN_RIGHT) - bool(btn & BTN_LEFT)
+        if self.dy or self.dx:
+            self.autowalk = None
+            self.move_start()
+        elif btn & BTN_A:
+            self.autowalk = None
+            if Window.all:
                 Window.close()
-                if ret == 0:
-                    self.battle_start(7, "boss3")
-            # バトルのコマンド選択
-            elif cur.key == "bt_command":
-                self.cur = None
-                if ret == 0:
-                    self.battle_attack()
-                elif ret == 1:
-                    self.battle_spells()
-                elif ret == 2:
-                    self.battle_run()
-            # バトル呪文の選択肢
-            elif cur.key == "bt_spells":
-                if ret >= 0:
-                    spl_id = self.available_spells(True)[ret]
-                    spl = self.spells[spl_id]
-                    mp = spl.get_mp(self.pl)
-                    if mp and mp <= self.pl.mp:
-                        self.pl.mp -= mp
-                        self.cur = None
-                        self.bt_msg = [f"{self.pl.name}は {spl.name}をとなえた"]
-                        if spl_id == SPELL_FIRE:
-                            dmg = 0 if self.ms.resist else px.rndi(24, 30)
-                            self.battle_damage(self.ms, dmg)
-                        elif spl_id == SPELL_HEAL:
-                            ret = self.use_heal(mp)
-                            self.bt_msg += [f"{ret}HP かいふくした"]
-                        elif spl_id == SPELL_BURST:
-                            dmg = 0
-                            for _ in range(mp):
-                                dmg += px.rndi(8, 12)
-                            self.battle_damage(self.ms, dmg)
-                        self.battle_show()
-                else:
-                    self.battle_command()
-                    self.cur.pos = 1
-        # フィールド用update処理
-        elif self.scene == "field":
-            # 操作受付
-            if not self.moving:
-                self.dy = btn["d"] - btn["u"]
-                self.dx = btn["r"] - btn["l"] if not self.dy else 0
-                if self.dy or self.dx:
-                    self.move_start()
-                elif btn["a"]:
-                    Window.close()
-                elif btn["b"]:  # メニュー呼び出し
-                    self.menu_show()
-                    self.scene = "menu"
-            # 移動実処理
+            elif btn & BTN_A_PRESS:  # 自動移動の行き先選択（押しっぱなしでは開かない）
+                self.goto_show()
+        elif btn & BTN_B:  # メニュー呼び出し
+            self.autowalk = None
+            self.menu_show()
+            self.scene = "menu"
+        elif self.autowalk is not None:
+            self.autowalk_step()
+
+    # バトル（ターン送り）
+    @handler(SCENE_HANDLERS, "battle")
+    def update_battle(self, btn):
+        if btn & (BTN_A | BTN_B):
+            # どちらかが倒れた
+            if self.pl.hp <= 0:
+                self.battle_end(BATTLE_LOSE)
+                self.game_over()
+            elif self.ms.hp <= 0:
+                self.battle_win()
+            # 攻守が入れ替わる
+            elif self.bt_my_turn:
+                self.battle_monster_action()
             else:
-                self.dy += self.spd * ((self.dy > 0) - (self.dy < 0))
-                self.dx += self.spd * ((self.dx > 0) - (self.dx < 0))
-                # 移動終了
-                if (self.dy % 16, self.dx % 16) == (0, 0):
-                    self.move_end()
-        # バトル用update処理（ターン送り）
-        elif self.scene == "battle":
-            if btn["a"] or btn["b"]:
-                # どちらかが倒れた
-                if self.pl.hp <= 0:
-                    self.game_over()
-                elif self.ms.hp <= 0:
-                    self.battle_win()
-                # 攻守が入れ替わる
-                elif self.bt_my_turn:
-                    self.battle_monster_action()
-                else:
-                    self.battle_command()
-        # ゲームオーバー
-        elif self.scene == "gameover":
-            if btn["a"] or btn["b"]:
-                self.gold = self.gold // 2
-                self.go_start_location()
-                self.pl.hp = 1
-                self.field_start()
-
-    # pyxel drawメイン
+                self.battle_command()
+
+    # オートマップ（ABボタンでフィールドにもどる）
+    @handler(SCENE_HANDLERS, "automap")
+    def update_automap(self, btn):
+        if self.pressed & (BTN_A | BTN_B):
+            self.field_start()
+
+    # ゲームオーバー
+    @handler(SCENE_HANDLERS, "gameover")
+    def update_gameover(self, btn):
+        if btn & (BTN_A | BTN_B):
+            self.gold = self.gold // 2
+            self.go_start_location()
+            self.pl.hp = 1
+            self.field_start()
+
+    # pyxel drawメイン（前回と同じ画面なら描き直さない。pyxelの画面は次のフレームまで残る）
     def draw(self):
-        px.cls(0)
+        state = self.screen_state()
+        if state is not None and state == self.drawn:
+            return
+        self.drawn = state
+        GFX.cls(0)
         # 起動画面用draw処理
         if self.scene == "welcome":
             draw_text(3, 2, "Pyxel Tiny")
@@ -492,35 +1307,60 @@ class App:
         elif self.scene == "field":
             # マップ
             x, y = (self.x * 16 + self.dx, self.y * 16 + self.dy)
-            px.bltm(8, 0, self.z, x - 48, y - 48, 112, 112)
+            GFX.bltm(8, 0, self.z, x - 48, y - 48, 112, 112)
             # 障害物（NPC含む）
-            for key in self.obstacles:
-                if not key in self.flags:
-                    ob = self.obstacles[key]
-                    ob.draw(x, y, self.z)
+            self.obstacles.draw(x, y, self.z)
             # マスク
-            px.blt(0, -8, 0, 64, 0, 64, 64, 1)
-            px.blt(64, -8, 0, 64, 0, -64, 64, 1)
-            px.blt(0, 56, 0, 64, 0, 64, -64, 1)
-            px.blt(64, 56, 0, 64, 0, -64, -64, 1)
+            GFX.blt(0, -8, 0, 64, 0, 64, 64, 1)
+            GFX.blt(64, -8, 0, 64, 0, -64, 64, 1)
+            GFX.blt(0, 56, 0, 64, 0, 64, -64, 1)
+            GFX.blt(64, 56, 0, 64, 0, -64, -64, 1)
             # 主人公
             (u, v) = ((px.frame_count % 30) // 15 * 16, 2 * 16)
-            px.blt(56, 48, 0, u, v, 16, 16, 1)
+            GFX.blt(56, 48, 0, u, v, 16, 16, 1)
             # ステータス表示
-            px.rect(0, 112, 128, 16, 0)
+            GFX.rect(0, 112, 128, 16, 0)
             t = f"HP{pad(self.pl.hp,3)} MP{pad(self.pl.mp,2)} {pad(self.gold,4)}G"
             draw_text(0, 14, t)
         # バトル用draw処理（モンスターグラフィック表示）
         elif self.scene == "battle":
             u = self.ms.img % 4 * 64
             v = self.ms.img // 4 * 64 + 64
-            px.blt(0, 0, 0, u, v, 64, 64)
+            GFX.blt(0, 0, 0, u, v, 64, 64)
+        # オートマップ
+        elif self.scene == "automap":
+            self.automap.draw(self.x, self.y, self.z, px.frame_count % 30 < 15)
+            draw_text(0, 14, f"ちか{self.z+1}かい  (Zキーで もどる)")
         # ウィンドウ
         for key in Window.all:
             Window.all[key].draw()
         # カーソル
         if self.cur:
             self.cur.draw()
+        # 早送り・自動送り中の表示（左上に小さく）
+        if self.turbo > 1 or self.auto_battle:
+            t = f"x{self.turbo}" + (" AUTO" if self.auto_battle else "")
+            GFX.rect(0, 0, len(t) * 4 + 1, 7, 0)
+            GFX.text(1, 1, t, 7)
+
+    # 画面に映る状態（位置、アニメーションの段階、ウィンドウの内容、カーソル位置）
+    def screen_state(self):
+        view = None
+        if self.scene == "field":
+            pl = self.pl
+            phase = px.frame_count % 30 // 15
+            view = (self.x, self.y, self.z, self.dx, self.dy, phase)
+            view += (pl.hp, pl.mp, self.gold, self.obstacles.version)
+        elif self.scene == "battle":
+            view = self.ms.img
+        elif self.scene == "automap":
+            view = (self.x, self.y, self.z, px.frame_count % 30 // 15)
+        wins = tuple(
+            (w.x1, w.y1, w.x2, w.y2, tuple(w.texts)) for w in Window.all.values()
+        )
+        cur = self.cur
+        cur = cur and (cur.list_x[cur.pos], cur.list_y[cur.pos])
+        return (self.scene, view, wins, cur, self.turbo, self.auto_battle)
 
     ### システム関連 ###
 
@@ -540,75 +1380,145 @@ class App:
         self.go_start_location()
         self.gold = 0
         self.keys = 0  # カギの数
-        self.flags = []  # フラグ（宝箱、扉などの判定用）
-        self.enc = 0  # エンカウント
+        self.load_flags(Flags())  # フラグ（宝箱、扉などの判定用）
+        self.automap.reset()  # 歩いたところ
+        self.enc = 0  # エンカウント（最後の戦闘からの歩数）
+        self.schedule_encounter()
         self.frames = 0
 
-    # データロード
+    # データロード（セーブデータがない、または壊れていたらニューゲーム）
     def load_data(self):
         try:
-            if IS_WEB:
-                data_str = window.localStorage.getItem("pyxel-tiny-drpg")
-            else:
-                with open(get_data_file(), mode="r", encoding="utf-8") as f:
-                    data_str = f.read()
-            data = json.loads(data_str)
-            self.x = data["x"]
-            self.y = data["y"]
-            self.z = data["z"]
-            self.gold = data["gold"]
-            self.keys = data["keys"]
-            self.flags = data["flags"]
-            self.enc = data["enc"]
-            self.frames = data["frames"]
-            self.pl = Actor(
-                data["name"],
-                data["mhp"],
-                data["mmp"],
-                data["atk"],
-                data["spd"],
-            )
-            self.pl.hp = data["hp"]
-            self.pl.mp = data["mp"]
-            return True
-        except Exception:
-            # ロード失敗（初回プレイ）
+            data = self.read_save()
+        except (OSError, ValueError):
+            data = None
+        if data is None:
             self.new_game()
             return False
+        self.x = data["x"]
+        self.y = data["y"]
+        self.z = data["z"]
+        self.gold = data["gold"]
+        self.keys = data["keys"]
+        self.load_flags(Flags(data["flags"]))
+        if "automap" in data:
+            self.automap.loads(base64.b64decode(data["automap"]))
+        else:  # オートマップのない古いセーブデータ
+            self.automap.reset()
+        self.enc = data["enc"]
+        self.schedule_encounter()
+        self.frames = data["frames"]
+        self.pl = Actor(
+            data["name"],
+            data["mhp"],
+            data["mmp"],
+            data["atk"],
+            data["spd"],
+        )
+        self.pl.hp = data["hp"]
+        self.pl.mp = data["mp"]
+        return True
 
     # データセーブ
     def save_data(self):
-        try:
-            data = {
-                "x": self.x,
-                "y": self.y,
-                "z": self.z,
-                "gold": self.gold,
-                "keys": self.keys,
-                "flags": self.flags,
-                "enc": self.enc,
-                "frames": self.frames,
-                "name": self.pl.name,
-                "hp": self.pl.hp,
-                "mhp": self.pl.mhp,
-                "mp": self.pl.mp,
-                "mmp": self.pl.mmp,
-                "atk": self.pl.atk,
-                "spd": self.pl.spd,
-            }
-            data_str = json.dumps(data)
-            if IS_WEB:
-                window.localStorage.setItem("pyxel-tiny-drpg", data_str)
-            else:
-                with open(get_data_file(), "w", encoding="utf_8") as f:
-                    f.write(data_str)
-        except Exception:
-            pass
+        self.write_save(self.save_dict())
+
+    # セーブデータ（save_dict 形式）をバイナリ形式で書き込む
+    # web 版は base64 にして localStorage へ
+    def write_save(self, data):
+        data = SaveData.dumps(data)
+        if IS_WEB:
+            try:
+                window.localStorage.setItem(SAVE_KEY, base64.b64encode(data).decode())
+            except Exception:
+                self.save_error = True
+        else:
+            if self.saver is None:
+                self.saver = SaveWriter(get_data_file())
+            self.saver.put(data)
+
+    # セーブに失敗していたら True（通知は1回だけ）
+    def save_failed(self):
+        failed = self.save_error or (self.saver and self.saver.take_error())
+        self.save_error = False
+        return bool(failed)
+
+    # セーブデータを読む（save_dict 形式、なければ None。壊れていたら ValueError）
+    def read_save(self):
+        if self.saver:
+            self.saver.flush()
+        return self.read_storage()
+
+    # 保存先からセーブデータを読む。旧形式（JSON）ならバイナリ形式で保存し直す
+    def read_storage(self):
+        if IS_WEB:
+            text = window.localStorage.getItem(SAVE_KEY)
+            if not text:
+                return None
+            if not text.startswith("{"):
+                return SaveData.loads(base64.b64decode(text))
+        else:
+            filename = get_data_file()
+            if os.path.exists(filename):
+                with open(filename, "rb") as f:
+                    return SaveData.loads(f.read())
+            filename = get_data_file(SAVE_FILE_JSON)
+            if not os.path.exists(filename):
+                return None
+            with open(filename, encoding="utf-8") as f:
+                text = f.read()
+        data = SaveData.from_json(text)
+        self.write_save(data)
+        return data
+
+    # セーブ対象の状態
+    def save_dict(self):
+        return {
+            "x": self.x,
+            "y": self.y,
+            "z": self.z,
+            "gold": self.gold,
+            "keys": self.keys,
+            "flags": self.flags.to_list(),
+            "automap": base64.b64encode(self.automap.dumps()).decode(),
+            "enc": self.enc,
+            "frames": self.frames,
+            "name": self.pl.name,
+            "hp": self.pl.hp,
+            "mhp": self.pl.mhp,
+            "mp": self.pl.mp,
+            "mmp": self.pl.mmp,
+            "atk": self.pl.atk,
+            "spd": self.pl.spd,
+        }
+
+    # 入力を読む
+    # tick: 早送りで同じフレームの2回目以降なら、ABボタンは押していないことにする
+    # バトルの自動送り中は、カーソルがなければ一定間隔でAボタンを押したことにする
+    def read_input(self, tick=0):
+        btn = get_btn_state()
+        if tick:
+            btn = btn & BTN_DIRS | BTN_TURBO
+        if self.auto_battle and self.scene == "battle" and not self.cur:
+            self.auto_ticks += 1
+            if self.auto_ticks >= AUTO_BATTLE_TICKS:
+                btn |= BTN_A
+                self.auto_ticks = 0
+        else:
+            self.auto_ticks = 0
+        return btn
+
+    # 終了
+    def quit(self):
+        if self.saver:
+            self.saver.flush()
+        px.quit()
 
     # メッセージ
     def message(self, msg):
         Window.open("msg", 0, 10, 16, 16, msg)
         self.wait = True
+        self.buffered = 0
 
     # BGM
     def play_bgm(self, bgm):
@@ -659,20 +1569,94 @@ class App:
     def event(self):
         x = self.x + self.dx
         y = self.y + self.dy
-        tm = px.tilemaps[self.z].pget(x * 2, y * 2)
-        if tm == (0, 2):
-            return "-"  # 壁
-        elif tm == (2, 2):
-            return "@"  # 泉
-        elif tm == (4, 0):
-            return "<"  # 上り階段
-        elif tm == (6, 0):
-            return ">"  # 下り階段
-        for key in self.obstacles:
-            ob = self.obstacles[key]
-            if not key in self.flags and (ob.x, ob.y, ob.z) == (x, y, self.z):
-                return key
-        return ""
+        terrain = self.terrain.get(x, y, self.z)
+        if terrain:
+            return TERRAIN_EVENTS[terrain]  # 壁、泉、階段
+        return self.obstacles.key_at(x, y, self.z)
+
+    # フラグを立てる（扉・宝箱・NPCなら障害物を消し、その階の距離表を作り直す）
+    def set_flag(self, key):
+        self.flags.add(key)
+        if key in self.obstacles:
+            self.obstacles.remove(key)
+            z = self.obstacles.z[self.obstacles.rows[key]]
+            self.fields = {k: v for k, v in self.fields.items() if k[0] != z}
+
+    # フラグ一式を読み込んで障害物と距離表を合わせる
+    def load_flags(self, flags):
+        self.flags = flags
+        self.obstacles.reset(flags)
+        self.fields = {}
+
+    # 行き先までの距離（マス数）の表。一度作った表は使い回す
+    def distance_field(self, z, dest):
+        field = self.fields.get((z, dest))
+        if field is None:
+            field = self.fields[(z, dest)] = self.build_distance_field(z, dest)
+        return field
+
+    # 行き先から幅優先探索で距離の表を作る（壁、泉、ほかの階段、障害物は通れない）
+    def build_distance_field(self, z, dest):
+        w = self.terrain.width
+        grid = self.terrain.grids[z]
+        obs = self.obstacles
+        dist = array("H", [UNREACHABLE]) * len(grid)
+        blocked = set()
+        for i in obs.floors.get(z, []):
+            if obs.alive[i]:
+                blocked.add(obs.y[i] * w + obs.x[i])
+        if isinstance(dest, str):
+            i = obs.rows[dest]
+            queue = [obs.y[i] * w + obs.x[i]] if obs.alive[i] and obs.z[i] == z else []
+        else:
+            queue = [i for i, terrain in enumerate(grid) if terrain == dest]
+        for i in queue:
+            dist[i] = 0
+        n = len(grid)
+        for i in queue:
+            d = dist[i] + 1
+            x = i % w
+            # 上下左右のうち階の中のマスだけ（外は壁。左右の端で隣の行に回り込まない）
+            near = [j for j in (i - w, i + w) if 0 <= j < n]
+            if x > 0:
+                near.append(i - 1)
+            if x < w - 1:
+                near.append(i + 1)
+            for j in near:
+                if dist[j] == UNREACHABLE and not grid[j] and not j in blocked:
+                    dist[j] = d
+                    queue.append(j)
+        return dist
+
+    # 自動移動の行き先ウィンドウ生成（今いる階でたどり着ける所だけ）
+    def goto_show(self):
+        here = self.y * self.terrain.width + self.x
+        t = " "
+        list_x = []
+        self.goto_list = []
+        for name, dest in DESTINATIONS:
+            if 0 < self.distance_field(self.z, dest)[here] < UNREACHABLE:
+                list_x.append(len(t))
+                t += name + " "
+                self.goto_list.append(dest)
+        if list_x:
+            self.message(["どこへ いきますか？", t])
+            self.cur = Cursor("goto", list_x, 14, -1, BTN_A_PRESS)
+
+    # 自動移動（1歩）：距離が1つ小さいマスへ進み、最後は行き先に入って終了
+    def autowalk_step(self):
+        w = self.terrain.width
+        dist = self.distance_field(self.z, self.autowalk)
+        here = dist[self.y * w + self.x]
+        for dx, dy in ((0, -1), (0, 1), (-1, 0), (1, 0)):
+            d = dist[(self.y + dy) * w + self.x + dx]
+            if d < here:
+                if d == 0:
+                    self.autowalk = None
+                self.dx, self.dy = (dx, dy)
+                self.move_start()
+                return
+        self.autowalk = None
 
     # フィールド処理開始
     def field_start(self):
@@ -680,7 +1664,10 @@ class App:
         self.scene = "field"
         self.field_bgm()
         self.moving = False
+        self.buffered = 0  # 移動中に押されたボタン
+        self.autowalk = None  # 自動移動の行き先
         (self.dx, self.dy, self.spd) = (0, 0, 4)
+        self.automap.reveal(self.x, self.y, self.z)
 
     # フィールドBGM
     def field_bgm(self):
@@ -709,7 +1696,7 @@ class App:
                 if self.keys:
                     px.play(3, 33)
                     self.message(["カギを あけた"])
-                    self.flags.append(evt)
+                    self.set_flag(evt)
                     self.keys -= 1
                     self.wait = True
                 else:
@@ -724,7 +1711,7 @@ class App:
                     t.append(f"カギを てにいれた")
                     self.keys += 1
                 self.message(t)
-                self.flags.append(evt)
+                self.set_flag(evt)
                 px.play(3, 35)
             # NPC
             if evt == "0-1" and "4-3" in self.flags:
@@ -735,7 +1722,7 @@ class App:
                 self.shop_show()
             elif evt == "1-2" and not "sp1" in self.flags:
                 self.message(["リターンの じゅもんを", "さずけよう"])
-                self.flags.append("sp1")
+                self.set_flag("sp1")
             elif evt == "2-5" and not "sp2" in self.flags:
                 self.message(["じゅんびは よいか？", " はい  いいえ"])
                 self.cur = Cursor("boss1", [1, 5], 14, 1)
@@ -756,20 +1743,25 @@ class App:
         self.dy = 0
         self.dx = 0
         self.moving = False
-        if self.event in ("<", ">"):  # 階段
-            self.z += 1 if self.event == ">" else -1
+        self.automap.reveal(self.x, self.y, self.z)
+        evt = self.event
+        if evt in ("<", ">"):  # 階段
+            self.z += 1 if evt == ">" else -1
+            self.automap.reveal(self.x, self.y, self.z)
             # エンディング判定
             if self.z == 0 and "4-3" in self.flags and not "end" in self.flags:
                 s = self.frames // 30
                 m = s // 60
                 s %= 60
                 self.message(["ゲームクリア！", f"タイム：{m}ふん{s}びょう"])
-                self.flags.append("end")
+                self.set_flag("end")
             else:
                 self.message([f"ちか{self.z+1}かい"])
             self.field_bgm()
             px.play(3, 34)
             self.wait = True
+            if AUTOSAVE:
+                self.save_data()
             return
         if (self.x + self.y) % 2 == 0:
             self.pl.hp = min(self.pl.hp + 1, self.pl.mhp)
@@ -777,12 +1769,19 @@ class App:
         if self.z == 0 or ("4-3" in self.flags and not "end" in self.flags):
             return
         self.enc += 1
-        if self.enc > 12 and px.rndi(0, 7) == 0:
+        if self.enc >= self.enc_next:
             self.enc = 0
-            ms_id = self.z - (1 if px.rndi(0, 3) < 3 else 0)
+            self.schedule_encounter()
+            ms_id = self.z - (1 if self.rng.encounter.rndi(0, 3) < 3 else 0)
             self.battle_start(ms_id)
 
+    # 次にエンカウントする歩数を決める（1歩ごとの抽選と同じ分布の幾何分布で1回だけ引く）
+    def schedule_encounter(self):
+        steps = self.rng.encounter.geometric(ENCOUNTER_RATE)
+        self.enc_next = max(self.enc, ENCOUNTER_STEPS) + steps
+
     # ショップ用ウィンドウ生成
+    @handler(CURSOR_MOVED, "shop")
     def shop_show(self):
         t1, t2, cost = self.shop_get_item(self.cur.pos)
         if cost:
@@ -832,10 +1831,16 @@ class App:
             f" {pad(self.gold,4)}G  カギ {pad(self.keys,2)}こ",
         ]
         Window.open("menu_stat", 0, 0, 16, 10, t)
-        self.message([f"いま ちか{self.z+1}かいに います", " セーブ じゅもん リセット"])
-        self.cur = Cursor("menu", [1, 5, 10], 14, -1)
+        self.message([f"いま ちか{self.z+1}かい   ちず", " セーブ じゅもん リセット"])
+        self.cur = Cursor("menu", [1, 5, 10, 11], [14, 14, 14, 12], -1)
+
+    # オートマップ表示
+    def automap_show(self):
+        Window.close()
+        self.scene = "automap"
 
     # メニュー用呪文リスト
+    @handler(CURSOR_MOVED, "spells")
     def menu_spells(self):
         spells = self.available_spells()
         pos = self.cur.pos if self.cur else 0
@@ -865,7 +1870,8 @@ class App:
         self.bt_my_turn = True
         msg_pre = [f"{self.ms.name}が あらわれた"]
         # 先行判定
-        if self.pl.spd * px.rndf(1.0, 2.0) >= self.ms.spd * px.rndf(1.0, 2.0):
+        turn = self.rng.turn
+        if self.pl.spd * turn.rndf(1.0, 2.0) >= self.ms.spd * turn.rndf(1.0, 2.0):
             self.battle_command(msg_pre)
         else:
             self.bt_msg = msg_pre + ["てきに せんてをとられた"]
@@ -883,12 +1889,14 @@ class App:
     # コマンド選択
     def battle_command(self, msg_pre=[]):
         self.bt_my_turn = True
+        self.battle_event("turn")
         self.bt_msg = msg_pre + ["どうする？", " たたかう じゅもん にげる"]
         y = 8 + len(self.bt_msg) * 2
         self.cur = Cursor("bt_command", [1, 6, 11], y)
         self.battle_show()
 
     # バトル用呪文リスト
+    @handler(CURSOR_MOVED, "bt_spells")
     def battle_spells(self):
         spells = self.available_spells(True)
         pos = self.cur.pos if self.cur else 0
@@ -914,12 +1922,14 @@ class App:
             target = self.pl
         self.bt_msg = msg_pre + [f"{attacker.name}の こうげき"]
         hit_rate = max(min(attacker.spd / target.spd, 1.5), 0.25)
-        hit_rate = min(hit_rate - px.rndf(0.0, 1.0), 1.0)
+        hit_rate = min(hit_rate - self.rng.hit.rndf(0.0, 1.0), 1.0)
+        dmg = 0
         if hit_rate > 0.0:
             dmg = int(attacker.atk * (1 + hit_rate) / 2 + 0.99)
             self.battle_damage(target, dmg)
         else:  # 回避された
             self.bt_msg += [f"{target.name}は みをかわした"]
+        self.battle_event("attack" if self.bt_my_turn else "ms_attack", dmg)
         self.battle_show()
 
     # ダメージ処理
@@ -932,7 +1942,8 @@ class App:
     # 逃げる
     def battle_run(self):
         rate = 1.0 + self.pl.spd / self.ms.spd
-        if rate > px.rndf(0.0, 2.0):
+        if rate > self.rng.flee.rndf(0.0, 2.0):
+            self.battle_end(BATTLE_FLED)
             self.field_start()
             self.message(["にげのびた..."])
         else:
@@ -944,11 +1955,12 @@ class App:
         self.bt_my_turn = False
         # MPがある敵はファイアを使う
         spl = self.spells[SPELL_FIRE]
-        if self.ms.mp >= spl.mp and px.rndi(0, 1) == 0:
+        if self.ms.mp >= spl.mp and self.rng.turn.rndi(0, 1) == 0:
             self.ms.mp -= spl.mp
             self.bt_msg = [f"{self.ms.name}は{spl.name}をとなえた"]
-            dmg = px.rndi(12, 18)  # 敵のファイアは少し弱め
+            dmg = self.rng.damage.rndi(12, 18)  # 敵のファイアは少し弱め
             self.battle_damage(self.pl, dmg)
+            self.battle_event("ms_fire", dmg)
             self.battle_show()
         else:
             self.battle_attack(msg_pre)
@@ -957,20 +1969,32 @@ class App:
     def battle_win(self):
         self.field_start()
         t = ["たたかいに かった"]
+        gold = 0
         if self.bt_evt == "boss1":
             t += [f"「{self.spells[SPELL_HEAL].name}」を おぼえた"]
-            self.flags.append("sp2")
+            self.set_flag("sp2")
         elif self.bt_evt == "boss2":
             t += [f"「{self.spells[SPELL_BURST].name}」を おぼえた"]
-            self.flags.append("sp3")
+            self.set_flag("sp3")
         elif self.bt_evt == "boss3":
-            self.flags.append("4-3")
+            self.set_flag("4-3")
             t = ["ひほうを てにいれた！"]
         else:
-            gold = int(self.ms.gold * px.rndf(0.7, 1.0) + 0.99)
+            gold = int(self.ms.gold * self.rng.gold.rndf(0.7, 1.0) + 0.99)
             self.add_gold(gold)
             t += [f"{gold}G てにいれた"]
+        self.battle_end(BATTLE_WIN, gold)
         self.message(t)
 
+    # 戦闘中の行動1回（action: turn, attack, fire, heal, burst, run, ms_attack, ms_fire、
+    # value: ダメージ・回復量）。ゲームでは何もしない（tools/battle_log.py で記録する）
+    def battle_event(self, action, value=0):
+        pass
+
+    # 戦闘の終わり（result: BATTLE_WIN / BATTLE_LOSE / BATTLE_FLED、gold: 得たお金）
+    def battle_end(self, result, gold=0):
+        pass
+
 
-App()
+if __name__ == "__main__":
+    App()
@@ -0,0 +1,119 @@
+# バトルの記録（tools/run.py --battles battles.bin）
+#
+# 1戦1行の固定長レコードを、確保済みの列の配列にリングバッファで書く。行動ごとの記録は
+# 回数とダメージの列に足すだけなので、ターンごとのメモリ確保はない。書き出しはデータパック
+# 形式（"battles" 表、古い順）で、main.Pack.read で読める（tools/battle_report.py で集計）。
+# BattleLogging は App に足して使う（class DevApp(BattleLogging, App) のように App より先に）。
+from array import array
+
+from main import Pack, SaveWriter
+
+
+class BattleLog:
+    CAPACITY = 1024  # 保持する戦闘数（超えたら古いものから上書き）
+    COLUMNS = (
+        ("frame", "I"),  # 開始時のプレイ時間（フレーム）
+        ("monster", "B"),  # モンスターID
+        ("hp", "H"),  # 開始時の主人公の HP / 最大HP / MP / 最大MP / ちから / はやさ
+        ("mhp", "H"),
+        ("mp", "H"),
+        ("mmp", "H"),
+        ("atk", "H"),
+        ("spd", "H"),
+        ("turns", "H"),  # コマンドを選んだ回数
+        ("attacks", "H"),  # 主人公のこうげき回数と与えたダメージ（みかわされたら0）
+        ("attack_dmg", "I"),
+        ("fire", "H"),  # 主人公が唱えた呪文の回数と、与えたダメージ・回復量
+        ("fire_dmg", "I"),
+        ("heal", "H"),
+        ("healed", "I"),
+        ("burst", "H"),
+        ("burst_dmg", "I"),
+        ("ms_attacks", "H"),  # モンスターのこうげき回数と受けたダメージ
+        ("ms_attack_dmg", "I"),
+        ("ms_fire", "H"),  # モンスターのファイアの回数と受けたダメージ
+        ("ms_fire_dmg", "I"),
+        ("runs", "H"),  # にげるを選んだ回数
+        ("result", "B"),  # 0:途中 1:勝ち 2:負け 3:にげた
+        ("gold", "H"),  # 勝って得たお金
+    )
+    # App.battle_event の行動 → 回数の列と、ダメージ・回復量の列
+    ACTIONS = {
+        "turn": ("turns", None),
+        "attack": ("attacks", "attack_dmg"),
+        "fire": ("fire", "fire_dmg"),
+        "heal": ("heal", "healed"),
+        "burst": ("burst", "burst_dmg"),
+        "run": ("runs", None),
+        "ms_attack": ("ms_attacks", "ms_attack_dmg"),
+        "ms_fire": ("ms_fire", "ms_fire_dmg"),
+    }
+
+    def __init__(self):
+        self.cols = {
+            col: array(typ, bytes(array(typ).itemsize * self.CAPACITY))
+            for col, typ in self.COLUMNS
+        }
+        # 列ごとの最大値（回数・ダメージはここで止める）
+        self.limits = {
+            col: (1 << array(typ).itemsize * 8) - 1 for col, typ in self.COLUMNS
+        }
+        self.count = 0  # これまでに始まった戦闘数
+        self.pos = 0  # 記録中の行
+
+    # 戦闘開始（新しい行を作って開始時の状態を書く）
+    def begin(self, frame, monster, pl):
+        i = self.pos = self.count % self.CAPACITY
+        self.count += 1
+        for col in self.cols.values():
+            col[i] = 0
+        values = (frame, monster, pl.hp, pl.mhp, pl.mp, pl.mmp, pl.atk, pl.spd)
+        for (col, _), value in zip(self.COLUMNS, values):
+            self.cols[col][i] = value
+
+    # 行動1回（回数の列を1増やし、ダメージの列に value を足す。列の最大値で止める）
+    def add(self, action, value=0):
+        count, amount = self.ACTIONS[action]
+        i = self.pos
+        col = self.cols[count]
+        col[i] = min(col[i] + 1, self.limits[count])
+        if amount:
+            col = self.cols[amount]
+            col[i] = min(col[i] + value, self.limits[amount])
+
+    def end(self, result, gold=0):
+        self.cols["result"][self.pos] = result
+        self.cols["gold"][self.pos] = gold
+
+    # 記録している行を古い順に並べた列
+    def columns(self):
+        n = min(self.count, self.CAPACITY)
+        start = self.count % self.CAPACITY if n == self.CAPACITY else 0
+        return {col: data[start:n] + data[:start] for col, data in self.cols.items()}
+
+    def dumps(self):
+        return Pack.dumps({"battles": self.columns()})
+
+
+# バトルを記録する App（battles: 書き出し先のファイル名。戦闘が終わるたびに全体を書く）
+class BattleLogging:
+    def __init__(self, battles, **kwargs):
+        self.battle_log = BattleLog()
+        # セーブと同じく別スレッドで書く（失敗しても次の戦闘のあとにまた全体を書く）
+        self.battle_writer = SaveWriter(battles)
+        super().__init__(**kwargs)
+
+    def battle_start(self, ms_id, evt=None):
+        self.battle_log.begin(self.frames, ms_id, self.pl)
+        super().battle_start(ms_id, evt)
+
+    def battle_event(self, action, value=0):
+        self.battle_log.add(action, value)
+
+    def battle_end(self, result, gold=0):
+        self.battle_log.end(result, gold)
+        self.battle_writer.put(self.battle_log.dumps())
+
+    def quit(self):
+        self.battle_writer.flush()
+        super().quit()
@@ -0,0 +1,72 @@
+# バトルの記録の集計
+#
+# tools/run.py --battles battles.bin で書き出したバトルの記録
+# （tools/battle_log.py の BattleLog。データパック形式の "battles" 表）を読み、モンスターごとに
+# 戦闘数、勝ち・負け・にげた割合、ターン数、与えた・受けたダメージ、得たお金の平均を出力する。
+#
+#   python tools/battle_report.py battles.bin [battles2.bin ...]
+import argparse
+import os
+import sys
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+from battle_log import BattleLog  # noqa: E402
+from main import BATTLE_FLED, BATTLE_LOSE, BATTLE_WIN, Content, Pack  # noqa: E402
+
+DEALT = ("attack_dmg", "fire_dmg", "burst_dmg")
+TAKEN = ("ms_attack_dmg", "ms_fire_dmg")
+
+
+# 記録を読んで列をつなげ（複数ファイル可）、モンスターID → 行番号のリストを作る
+def load(filenames):
+    cols = {col: [] for col, _ in BattleLog.COLUMNS}
+    for filename in filenames:
+        table = Pack.read(filename)["battles"]
+        for col in cols:
+            cols[col] += table[col]
+    rows = {}
+    for i, monster in enumerate(cols["monster"]):
+        rows.setdefault(monster, []).append(i)
+    return cols, rows
+
+
+def mean(cols, names, rows):
+    return sum(cols[name][i] for name in names for i in rows) / len(rows)
+
+
+def report(cols, rows, monsters):
+    print(
+        f"{'monster':12} {'n':>5} {'win':>5} {'lose':>5} {'fled':>5}"
+        f" {'turns':>6} {'dealt':>7} {'taken':>7} {'gold':>6}"
+    )
+    for monster in sorted(rows):
+        r = rows[monster]
+        results = [cols["result"][i] for i in r]
+        rate = {k: results.count(k) / len(r) for k in range(4)}
+        name = monsters[monster][0] if monster < len(monsters) else str(monster)
+        name += " " * (12 - len(name.encode("shift_jis")))  # 全角は2桁
+        print(
+            f"{name} {len(r):5}"
+            f" {rate[BATTLE_WIN]:5.0%} {rate[BATTLE_LOSE]:5.0%}"
+            f" {rate[BATTLE_FLED]:5.0%}"
+            f" {mean(cols, ['turns'], r):6.1f}"
+            f" {mean(cols, DEALT, r):7.1f} {mean(cols, TAKEN, r):7.1f}"
+            f" {mean(cols, ['gold'], r):6.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バトルの記録の集計")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    cols, rows = load(args.files)
+    os.chdir(ROOT)
+    report(cols, rows, Content.load().monsters)
+
+
+if __name__ == "__main__":
+    main()
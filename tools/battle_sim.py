@@ -0,0 +1,292 @@
+# 戦闘モンテカルロシミュレータ
+#
+# App.battle_attack / battle_damage / battle_monster_action / battle_run と
+# 呪文（ファイア・バースト）のルールを NumPy で再現し、モンスターごとに
+# プレイヤー能力値のグリッドに対して大量の戦闘を一括でシミュレートする。
+#
+#   python tools/battle_sim.py                     # 全モンスター × 既定グリッド
+#   python tools/battle_sim.py --monster 4 -n 5000 --policy fire
+#   python tools/battle_sim.py --bench             # 素朴なループとの速度比較
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from main import CONTENT_FILE, CONTENT_PACK, SPELL_FIRE, Actor, Content  # noqa: E402
+
+_content = Content.load(
+    os.path.join(ROOT, CONTENT_PACK), os.path.join(ROOT, CONTENT_FILE)
+)
+MONSTERS = _content.monsters
+SPELLS = _content.spells
+FIRE_MP = SPELLS[SPELL_FIRE].mp
+
+# 戦闘結果
+ONGOING = 0
+WIN = 1
+LOSE = 2
+FLED = 3
+
+POLICIES = ("attack", "fire", "burst", "run")
+
+
+# 乱数（px.rndi / px.rndf と同じ範囲：rndi は両端を含む）
+def rndi(rng, a, b, n):
+    return rng.integers(a, b + 1, size=n)
+
+
+def rndf(rng, a, b, n):
+    return rng.uniform(a, b, size=n)
+
+
+# 通常攻撃（App.battle_attack）のダメージ。0 は回避
+def attack_damage(rng, atk, a_spd, t_spd):
+    hit_rate = np.clip(a_spd / t_spd, 0.25, 1.5)
+    hit_rate = np.minimum(hit_rate - rndf(rng, 0.0, 1.0, len(atk)), 1.0)
+    dmg = (atk * (1 + hit_rate) / 2 + 0.99).astype(np.int64)
+    return np.where(hit_rate > 0.0, dmg, 0)
+
+
+# 敵の行動（App.battle_monster_action）
+def monster_action(rng, st, idx):
+    if not len(idx):
+        return
+    use_fire = (st["mmp"][idx] >= FIRE_MP) & (rndi(rng, 0, 1, len(idx)) == 0)
+    fire = idx[use_fire]
+    st["mmp"][fire] -= FIRE_MP
+    dmg = np.empty(len(idx), dtype=np.int64)
+    dmg[use_fire] = rndi(rng, 12, 18, len(fire))
+    atk = idx[~use_fire]
+    dmg[~use_fire] = attack_damage(
+        rng, st["matk"][atk], st["mspd"][atk], st["pspd"][atk]
+    )
+    st["php"][idx] = np.maximum(st["php"][idx] - dmg, 0)
+    st["result"][idx[st["php"][idx] <= 0]] = LOSE
+
+
+# プレイヤーの行動（App.update の bt_command / bt_spells）
+def player_action(rng, st, idx, policy):
+    if not len(idx):
+        return
+    st["turns"][idx] += 1
+    dmg = np.zeros(len(idx), dtype=np.int64)
+    if policy == "run":
+        rate = 1.0 + st["pspd"][idx] / st["mspd"][idx]
+        st["result"][idx[rate > rndf(rng, 0.0, 2.0, len(idx))]] = FLED
+        return
+    melee = np.ones(len(idx), dtype=bool)
+    if policy == "fire":
+        cast = st["pmp"][idx] >= FIRE_MP
+        st["pmp"][idx[cast]] -= FIRE_MP
+        fire_dmg = rndi(rng, 24, 30, int(cast.sum()))
+        dmg[cast] = np.where(st["resist"][idx[cast]] > 0, 0, fire_dmg)
+        melee = ~cast
+    elif policy == "burst":
+        mp = st["pmp"][idx]
+        cast = mp > 0
+        if cast.any():
+            mp = mp[cast]
+            rolls = rndi(rng, 8, 12, (int(cast.sum()), int(mp.max())))
+            rolls[np.arange(rolls.shape[1]) >= mp[:, None]] = 0
+            dmg[cast] = rolls.sum(axis=1)
+            st["pmp"][idx[cast]] = 0
+        melee = ~cast
+    atk = idx[melee]
+    dmg[melee] = attack_damage(rng, st["patk"][atk], st["pspd"][atk], st["mspd"][atk])
+    st["mhp"][idx] = np.maximum(st["mhp"][idx] - dmg, 0)
+    st["result"][idx[st["mhp"][idx] <= 0]] = WIN
+
+
+# 1体のモンスターに対して builds（hp, mp, atk, spd の配列）× n 回の戦闘を実行
+def simulate(ms_id, builds, n, policy="attack", seed=None, max_turns=200):
+    rng = np.random.default_rng(seed)
+    builds = np.asarray(builds, dtype=np.int64)
+    size = len(builds) * n
+    _, hp, mp, atk, spd, resist, _, gold = MONSTERS[ms_id]
+    rep = np.repeat(builds, n, axis=0)
+    st = {
+        "php": rep[:, 0].copy(),
+        "pmp": rep[:, 1].copy(),
+        "patk": rep[:, 2].astype(np.float64),
+        "pspd": rep[:, 3].astype(np.float64),
+        "mhp": np.full(size, hp, dtype=np.int64),
+        "mmp": np.full(size, mp, dtype=np.int64),
+        "matk": np.full(size, atk, dtype=np.float64),
+        "mspd": np.full(size, spd, dtype=np.float64),
+        "resist": np.full(size, resist, dtype=np.int64),
+        "turns": np.zeros(size, dtype=np.int64),
+        "result": np.zeros(size, dtype=np.int8),
+    }
+    # 先行判定（App.battle_start）：負けたら敵が先に行動する
+    first = st["pspd"] * rndf(rng, 1.0, 2.0, size) >= st["mspd"] * rndf(
+        rng, 1.0, 2.0, size
+    )
+    monster_action(rng, st, np.flatnonzero(~first))
+    for _ in range(max_turns):
+        idx = np.flatnonzero(st["result"] == ONGOING)
+        if not len(idx):
+            break
+        player_action(rng, st, idx, policy)
+        monster_action(rng, st, idx[st["result"][idx] == ONGOING])
+    # 勝利時の報酬（App.battle_win）
+    won = st["result"] == WIN
+    reward = np.zeros(size, dtype=np.int64)
+    reward[won] = (gold * rndf(rng, 0.7, 1.0, int(won.sum())) + 0.99).astype(np.int64)
+    shape = (len(builds), n)
+    return {
+        "result": st["result"].reshape(shape),
+        "turns": st["turns"].reshape(shape),
+        "hp_loss": (rep[:, 0] - st["php"]).reshape(shape),
+        "gold": reward.reshape(shape),
+    }
+
+
+# 素朴な実装（Actor オブジェクトを1戦ずつループ）。ベンチマークと検算用
+def simulate_naive(ms_id, build, n, policy="attack", seed=None, max_turns=200):
+    rnd = random.Random(seed)
+    rndi1 = lambda a, b: rnd.randint(a, b)
+    rndf1 = lambda a, b: rnd.uniform(a, b)
+
+    def attack(attacker, target):
+        hit_rate = max(min(attacker.spd / target.spd, 1.5), 0.25)
+        hit_rate = min(hit_rate - rndf1(0.0, 1.0), 1.0)
+        if hit_rate > 0.0:
+            target.hp = max(
+                target.hp - int(attacker.atk * (1 + hit_rate) / 2 + 0.99), 0
+            )
+
+    def monster(pl, ms):
+        if ms.mp >= FIRE_MP and rndi1(0, 1) == 0:
+            ms.mp -= FIRE_MP
+            pl.hp = max(pl.hp - rndi1(12, 18), 0)
+        else:
+            attack(ms, pl)
+
+    results = []
+    for _ in range(n):
+        pl = Actor("あなた", *build)
+        ms = Actor(*MONSTERS[ms_id])
+        result, turns = ONGOING, 0
+        if pl.spd * rndf1(1.0, 2.0) < ms.spd * rndf1(1.0, 2.0):
+            monster(pl, ms)
+            if pl.hp <= 0:
+                result = LOSE
+        while result == ONGOING and turns < max_turns:
+            turns += 1
+            if policy == "run":
+                if 1.0 + pl.spd / ms.spd > rndf1(0.0, 2.0):
+                    result = FLED
+                    break
+            elif policy == "fire" and pl.mp >= FIRE_MP:
+                pl.mp -= FIRE_MP
+                dmg = 0 if ms.resist else rndi1(24, 30)
+                ms.hp = max(ms.hp - dmg, 0)
+            elif policy == "burst" and pl.mp > 0:
+                dmg = sum(rndi1(8, 12) for _ in range(pl.mp))
+                pl.mp = 0
+                ms.hp = max(ms.hp - dmg, 0)
+            else:
+                attack(pl, ms)
+            if ms.hp <= 0:
+                result = WIN
+                break
+            monster(pl, ms)
+            if pl.hp <= 0:
+                result = LOSE
+        gold = int(ms.gold * rndf1(0.7, 1.0) + 0.99) if result == WIN else 0
+        results.append((result, turns, pl.mhp - pl.hp, gold))
+    return results
+
+
+# "30,60,120" または "30:120:30"（開始:終了:刻み、終了を含む）を数値リストに
+def parse_range(text):
+    if ":" in text:
+        start, stop, step = (int(v) for v in text.split(":"))
+        return list(range(start, stop + 1, step))
+    return [int(v) for v in text.split(",")]
+
+
+def report(ms_id, builds, res, policy):
+    name = MONSTERS[ms_id][0]
+    print(f"== {ms_id}: {name} (policy={policy})")
+    print(
+        "  hp  mp atk spd |   win   fled | turns p50 p90 | hp_loss mean  p50  p90 | gold"
+    )
+    for i, (hp, mp, atk, spd) in enumerate(builds):
+        result = res["result"][i]
+        won = result == WIN
+        turns = res["turns"][i][won]
+        loss = res["hp_loss"][i]
+        t50, t90 = np.percentile(turns, [50, 90]) if len(turns) else (0, 0)
+        l50, l90 = np.percentile(loss, [50, 90])
+        print(
+            f" {hp:3d} {mp:3d} {atk:3d} {spd:3d} |"
+            f" {won.mean():5.1%} {(result == FLED).mean():6.1%} |"
+            f"       {t50:3.0f} {t90:3.0f} |"
+            f"         {loss.mean():5.1f} {l50:4.0f} {l90:4.0f} |"
+            f" {res['gold'][i][won].mean() if won.any() else 0:4.0f}"
+        )
+
+
+def bench(ms_id, n, policy, seed):
+    build = (60, 10, 20, 20)
+    start = time.perf_counter()
+    naive = simulate_naive(ms_id, build, n, policy, seed)
+    t_naive = time.perf_counter() - start
+    start = time.perf_counter()
+    res = simulate(ms_id, [build], n, policy, seed)
+    t_vec = time.perf_counter() - start
+    naive_win = sum(r[0] == WIN for r in naive) / n
+    vec_win = (res["result"] == WIN).mean()
+    print(f"monster={MONSTERS[ms_id][0]} build={build} fights={n} policy={policy}")
+    print(
+        f"  naive  : {t_naive:8.3f}s {n / t_naive:12,.0f} fights/s win={naive_win:.3f}"
+    )
+    print(f"  numpy  : {t_vec:8.3f}s {n / t_vec:12,.0f} fights/s win={vec_win:.3f}")
+    print(f"  speedup: {t_naive / t_vec:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="戦闘バランスのモンテカルロ検証")
+    parser.add_argument("--monster", type=int, action="append", help="モンスター番号")
+    parser.add_argument("-n", type=int, default=2000, help="能力値1組あたりの戦闘数")
+    parser.add_argument("--hp", default="30,60,120,200")
+    parser.add_argument("--mp", default="6,20")
+    parser.add_argument("--atk", default="12,30,60")
+    parser.add_argument("--spd", default="12,30,60")
+    parser.add_argument("--policy", choices=POLICIES, default="attack")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--bench", action="store_true", help="素朴なループと比較")
+    args = parser.parse_args()
+    monsters = args.monster or range(len(MONSTERS))
+    if args.bench:
+        for ms_id in monsters:
+            bench(ms_id, args.n * 50, args.policy, args.seed)
+        return
+    builds = list(
+        itertools.product(
+            parse_range(args.hp),
+            parse_range(args.mp),
+            parse_range(args.atk),
+            parse_range(args.spd),
+        )
+    )
+    start = time.perf_counter()
+    total = 0
+    for ms_id in monsters:
+        res = simulate(ms_id, builds, args.n, args.policy, args.seed)
+        report(ms_id, builds, res, args.policy)
+        total += res["result"].size
+    elapsed = time.perf_counter() - start
+    print(f"{total:,} fights in {elapsed:.2f}s ({total / elapsed:,.0f} fights/s)")
+
+
+if __name__ == "__main__":
+    main()
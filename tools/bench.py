@@ -0,0 +1,157 @@
+# シーンごとのフレーム時間ベンチマーク
+#
+# pyxel_stub（描画せず呼び出し回数だけ数える pyxel）の上で App を動かし、
+# welcome / field / menu / battle / gameover の各シーンについて
+# update + draw の1フレームあたりの時間（平均・p99）と描画呼び出し回数を計測する。
+# cls は描き直したフレームの割合（画面が前のフレームと同じなら描画を省く）。
+#
+#   python tools/bench.py                  # 計測して基準値と比較
+#   python tools/bench.py --save-baseline  # 現在の結果を基準値として保存
+#
+# 基準値（bench_baseline.json）は最初のコミット（baseline）の main.py を、同じ入力パターンを
+# ボタンの状態として update に渡して計測したもの。最適化前の元のゲームとの比較になる
+# （時間は計測したマシンによるので、同じマシンで測り直すときは --baseline で別ファイルに）。
+import argparse
+import json
+import os
+import sys
+import time
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+import pyxel_stub  # noqa: E402
+
+pyxel_stub.install()
+
+from main import App, Window  # noqa: E402
+
+SCENES = ("welcome", "field", "menu", "battle", "gameover")
+# pyxel_stub が数える描画呼び出し（画面と画像）
+CALLS = (
+    "cls",
+    "blt",
+    "bltm",
+    "text",
+    "rect",
+    "rectb",
+    "line",
+    "pset",
+    "Image.cls",
+    "Image.blt",
+    "Image.text",
+    "Image.rect",
+    "Image.pset",
+)
+BASELINE = os.path.join(TOOLS, "bench_baseline.json")
+
+# シーンごとの入力パターン（1要素1フレーム、ループする）
+IDLE = ""
+PATTERNS = {
+    "welcome": [IDLE] * 20 + ["r"],
+    "field": ["r"] * 10 + ["l"] * 10 + [IDLE] * 10,
+    "menu": [IDLE] * 20 + ["r"],
+    "battle": [IDLE] * 20 + ["r"],
+    "gameover": [IDLE],
+}
+
+
+def btn(keys):
+    return sum(1 << "udlrab".index(k) for k in keys)
+
+
+# シーンの初期状態を作る
+def setup(app, scene):
+    Window.close()
+    app.cur = None
+    app.rng.seed(0)
+    if scene == "welcome":
+        app.welcome_show()
+        return
+    app.new_game()
+    app.field_start()
+    if scene == "menu":
+        app.menu_show()
+        app.scene = "menu"
+    elif scene == "battle":
+        app.battle_start(0)
+    elif scene == "gameover":
+        app.game_over()
+
+
+def run_scene(app, scene, frames):
+    setup(app, scene)
+    pattern = [btn(keys) for keys in PATTERNS[scene]]
+    times = []
+    calls = {name: 0 for name in CALLS}
+    for i in range(frames):
+        pyxel_stub.frame_count += 1
+        pyxel_stub.reset_counts()
+        start = time.perf_counter()
+        app.update(pattern[i % len(pattern)])
+        app.draw()
+        times.append(time.perf_counter() - start)
+        for name in CALLS:
+            calls[name] += pyxel_stub.counts[name]
+    times.sort()
+    return {
+        "mean_us": sum(times) / frames * 1e6,
+        "p99_us": times[min(frames - 1, int(frames * 0.99))] * 1e6,
+        "calls": {name: calls[name] / frames for name in CALLS},
+    }
+
+
+def delta(now, base):
+    if not base:
+        return ""
+    return f" ({(now - base) / base:+.0%})"
+
+
+def report(results, baseline):
+    print(f"{'scene':9} {'mean(us)':>15} {'p99(us)':>15}  draw calls / frame")
+    for scene, res in results.items():
+        base = baseline.get(scene, {})
+        base_calls = base.get("calls", {})
+        calls = " ".join(
+            f"{name}={n:.1f}{delta(n, base_calls.get(name))}"
+            for name, n in res["calls"].items()
+            if n or base_calls.get(name)
+        )
+        print(
+            f"{scene:9}"
+            f" {res['mean_us']:7.1f}{delta(res['mean_us'], base.get('mean_us')):>8}"
+            f" {res['p99_us']:7.1f}{delta(res['p99_us'], base.get('p99_us')):>8}"
+            f"  {calls}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シーンごとのフレーム時間ベンチマーク")
+    parser.add_argument(
+        "--frames", type=int, default=3000, help="シーンごとのフレーム数"
+    )
+    parser.add_argument("--scene", action="append", choices=SCENES)
+    parser.add_argument("--baseline", default=BASELINE, help="基準値ファイル")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+    os.chdir(ROOT)
+    app = App()
+    results = {}
+    for scene in args.scene or SCENES:
+        run_scene(app, scene, 100)  # ウォームアップ
+        results[scene] = run_scene(app, scene, args.frames)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# データパックの作成
+#
+# content.json（障害物、会話、モンスター、呪文）を列ごとの配列にまとめた
+# バイナリ content.bin に変換する。起動時はこちらを1回で読み込む。
+# 障害物のキー・位置の重複などがあればエラーで終了する（ファイルは書かない）。
+#
+#   python tools/build_content.py                  # content.bin を作り直す
+#   python tools/build_content.py --stress 10000   # 障害物を水増しして読み込み時間を計測
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from main import CONTENT_FILE, CONTENT_PACK, Content, Pack  # noqa: E402
+
+
+# 読み込み時間（ファイル読み込みから Content 作成まで、最小値）
+def load_time(filename, repeat=20):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Content(Pack.read(filename))
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+
+# データの誤りを調べる（障害物のキー・位置の重複、障害物にない会話のキー）
+def validate(data):
+    errors = []
+    keys = {}
+    positions = {}
+    for ob in data.get("obstacles", []):
+        key = ob["key"]
+        pos = (ob["x"], ob["y"], ob["z"])
+        if key in keys:
+            errors.append(f"obstacle key {key!r} is used twice")
+        if pos in positions:
+            errors.append(f"obstacles {positions[pos]!r} and {key!r} at the same {pos}")
+        keys[key] = True
+        positions.setdefault(pos, key)
+    for talk in data.get("talks", []):
+        if talk["key"] not in keys:
+            errors.append(f"talk {talk['key']!r} has no obstacle")
+    return errors
+
+
+# 障害物を n 件追加したデータ（他と重ならない位置に宝箱を並べる）
+def stress(data, n):
+    obstacles = list(data["obstacles"])
+    for i in range(n):
+        z, pos = divmod(i, 64 * 64)
+        y, x = divmod(pos, 64)
+        obstacles.append(
+            {"key": f"s{i}", "x": x + 100, "y": y + 100, "z": z, "kind": 1, "val": i}
+        )
+    return dict(data, obstacles=obstacles)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="データパックの作成")
+    parser.add_argument("--source", default=os.path.join(ROOT, CONTENT_FILE))
+    parser.add_argument("--out", default=os.path.join(ROOT, CONTENT_PACK))
+    parser.add_argument(
+        "--stress", type=int, default=0, help="障害物を追加して計測（出力は一時ファイル）"
+    )
+    args = parser.parse_args()
+    with open(args.source, encoding="utf-8") as f:
+        data = json.load(f)
+    out = args.out
+    if args.stress:
+        data = stress(data, args.stress)
+        out = os.path.join(ROOT, "content-stress.bin")
+    errors = validate(data)
+    if errors:
+        for error in errors:
+            print(f"{args.source}: {error}", file=sys.stderr)
+        sys.exit(1)
+    start = time.perf_counter()
+    tables = Pack.from_rows(data)
+    with open(out, "wb") as f:
+        f.write(Pack.dumps(tables))
+    build = time.perf_counter() - start
+    rows = " ".join(f"{name}={len(data.get(name, []))}" for name in tables)
+    print(f"{os.path.basename(out)}: {rows}, {os.path.getsize(out):,} bytes")
+    print(f"build {build * 1000:.1f}ms, load {load_time(out) * 1000:.2f}ms")
+    if args.stress:
+        os.remove(out)
+
+
+if __name__ == "__main__":
+    main()
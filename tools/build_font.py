@@ -0,0 +1,125 @@
+# フォントのサブセット作成
+#
+# main.py の文字列リテラル（UIメッセージ）、content.json の文字列（会話・
+# モンスター・呪文）と zen() の全角化テーブルで使う文字だけを k8x12S.bdf から抜き出し、
+# k8x12S-subset.bdf に書き出す。起動時はこちらを読むので Font の読み込みが速くなる。
+#
+#   python tools/build_font.py          # サブセットを作り直す
+#   python tools/build_font.py --check  # サブセットに足りない文字がないか確認
+import argparse
+import ast
+import json
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from main import CONTENT_FILE, FONT_FILE, FONT_SUBSET_FILE, H2Z  # noqa: E402
+
+SOURCES = ("main.py", CONTENT_FILE)
+
+
+# ソース中の文字列リテラル（f文字列の固定部分を含む）、JSON 中の文字列を列挙
+def literals(filename):
+    with open(filename, encoding="utf-8") as f:
+        text = f.read()
+    if filename.endswith(".json"):
+        yield from json_strings(json.loads(text))
+        return
+    for node in ast.walk(ast.parse(text, filename)):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            yield node.value
+
+
+def json_strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from json_strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from json_strings(v)
+
+
+# 描画されうる文字の集合（そのままの文字と全角化後の文字）
+def used_chars(sources=SOURCES):
+    chars = set(map(chr, range(0x20, 0x7F)))
+    chars.update(chr(c) for c in H2Z.values())
+    for filename in sources:
+        for s in literals(os.path.join(ROOT, filename)):
+            chars.update(s)
+            chars.update(s.translate(H2Z))
+    return {c for c in chars if c.isprintable() or c == "　"}
+
+
+# BDF をヘッダとグリフ（encoding -> 行のリスト）に分ける
+def read_bdf(filename):
+    header, glyphs, block = [], {}, None
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("STARTCHAR"):
+                block = [line]
+            elif block is None:
+                if not line.startswith("ENDFONT"):
+                    header.append(line)
+            else:
+                block.append(line)
+                if line.startswith("ENCODING"):
+                    code = int(line.split()[1])
+                elif line.startswith("ENDCHAR"):
+                    glyphs[code] = block
+                    block = None
+    return header, glyphs
+
+
+def write_subset(src, dst, chars):
+    header, glyphs = read_bdf(src)
+    codes = sorted(c for c in map(ord, chars) if c in glyphs)
+    with open(dst, "w", encoding="utf-8", newline="\n") as f:
+        for line in header:
+            if line.startswith("CHARS "):
+                line = f"CHARS {len(codes)}\n"
+            f.write(line)
+        for code in codes:
+            f.writelines(glyphs[code])
+        f.write("ENDFONT\n")
+    missing = sorted(c for c in chars if ord(c) not in glyphs)
+    return len(codes), len(glyphs), missing
+
+
+def check(dst, chars):
+    if not os.path.exists(dst):
+        print(f"{dst} がありません")
+        return 1
+    _, glyphs = read_bdf(dst)
+    _, full = read_bdf(os.path.join(ROOT, FONT_FILE))
+    lack = sorted(c for c in chars if ord(c) in full and ord(c) not in glyphs)
+    if lack:
+        print(f"サブセットに無い文字 {len(lack)}: {''.join(lack)}")
+        return 1
+    print(f"OK ({len(glyphs)} glyphs)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フォントのサブセット作成")
+    parser.add_argument("--check", action="store_true", help="足りない文字の確認のみ")
+    args = parser.parse_args()
+    src = os.path.join(ROOT, FONT_FILE)
+    dst = os.path.join(ROOT, FONT_SUBSET_FILE)
+    chars = used_chars()
+    if args.check:
+        sys.exit(check(dst, chars))
+    n, total, missing = write_subset(src, dst, chars)
+    print(
+        f"{FONT_SUBSET_FILE}: {n}/{total} glyphs,"
+        f" {os.path.getsize(src):,} -> {os.path.getsize(dst):,} bytes"
+    )
+    if missing:
+        print(f"フォントに無い文字 {len(missing)}: {''.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# 配布用 main.pyxapp の作成（使っていないリソースを削って圧縮）
+#
+# pyxel_stub の上で App を動かし（起動画面、全モンスターの戦闘画面、メニュー、
+# ゲームオーバー、ボットによるニューゲームからクリアまでのプレイ）、blt の u/v 範囲、
+# bltm のタイルマップ（とそのタイルの画像範囲）、play / playm の音を記録する。
+# main.py 中の px.play / self.play_bgm の定数引数も使っている音に加える。
+# 記録に出てこないイメージの画素・タイルマップ・サウンド・ミュージックを空にした
+# assets.pyxres と、フォントはサブセット、データはバイナリパックだけを圧縮して詰め、
+# リソースごと・ファイルごとに削れたバイト数を出力する。
+#
+#   python tools/build_pyxapp.py                    # main.pyxapp を作り直す
+#   python tools/build_pyxapp.py --out /tmp/a.pyxapp --seed 3
+#
+# web 版（main.html）は作り直した main.pyxapp から `pyxel app2html main.pyxapp` で作る。
+import argparse
+import ast
+import io
+import json
+import os
+import re
+import sys
+import tomllib
+import zipfile
+import zlib
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+import pyxel_stub  # noqa: E402
+
+pyxel_stub.install()
+
+from main import CONTENT_PACK, FONT_SUBSET_FILE, App, Window  # noqa: E402
+from playthrough import MAX_FRAMES, Bot, Navigator  # noqa: E402
+
+APP_NAME = "pyxel-tiny-drpg"  # pyxapp 内のディレクトリ名
+STARTUP_SCRIPT = "main.py"
+STARTUP_SCRIPT_FILE = ".pyxapp_startup_script"
+RESOURCE_FILE = "assets.pyxres"
+RESOURCE_TOML = "pyxel_resource.toml"
+FILES = (STARTUP_SCRIPT, RESOURCE_FILE, CONTENT_PACK, FONT_SUBSET_FILE)
+SECTIONS = ("images", "tilemaps", "sounds", "musics")
+EMPTY = {
+    "tilemaps": {"data": [[0]]},
+    "sounds": {"notes": [], "tones": [], "volumes": [], "effects": [], "speed": 30},
+    "musics": {"seqs": []},
+}
+METADATA_FIELDS = ("title", "author", "desc", "site", "license", "version")
+METADATA_PATTERN = re.compile(r"#\s*(.+?)\s*:\s*(.+)")
+
+
+# 使っているリソース（pyxel_stub.trace に入れて呼び出しを受け取る）
+class Usage:
+    def __init__(self, res):
+        self.res = res
+        # イメージごとの使用マスク（1画素1バイト）
+        self.pixels = [bytearray(img["width"] * img["height"]) for img in res["images"]]
+        self.tilemaps = set()
+        self.sounds = set()
+        self.musics = set()
+
+    def append(self, call):
+        name, args = call
+        if name in ("blt", "Image.blt"):
+            if isinstance(args[2], int):  # オフスクリーン画像からの blt は対象外
+                self.rect(*args[2:7])
+        elif name == "bltm":
+            self.tilemap(args[2])
+        elif name == "play":
+            snd = args[1]
+            self.sounds.update(snd if isinstance(snd, list) else [snd])
+        elif name == "playm":
+            self.musics.add(args[0])
+            for seq in self.res["musics"][args[0]]["seqs"]:
+                self.sounds.update(seq)
+
+    # イメージ img の (u, v) から幅 w 高さ h（負なら反転）の範囲を使用済みにする
+    def rect(self, img, u, v, w, h):
+        width = self.res["images"][img]["width"]
+        height = self.res["images"][img]["height"]
+        mask = self.pixels[img]
+        x1, x2 = max(u, 0), min(u + abs(w), width)
+        for y in range(max(v, 0), min(v + abs(h), height)):
+            mask[y * width + x1 : y * width + x2] = b"\1" * max(x2 - x1, 0)
+
+    # タイルマップと、そこに並んでいるタイルの画像範囲を使用済みにする
+    def tilemap(self, tm):
+        if tm in self.tilemaps:
+            return
+        self.tilemaps.add(tm)
+        data = self.res["tilemaps"][tm]
+        tiles = {(0, 0)}  # 行末の省略された 0 の分
+        for row in data["data"]:
+            tiles.update(zip(row[0::2], row[1::2]))
+        for u, v in tiles:
+            self.rect(data["imgsrc"], u * 8, v * 8, 8, 8)
+
+
+# 画面を一通り表示し、ボットでクリアまでプレイして使っているリソースを記録
+def trace(res, seed, max_frames):
+    usage = pyxel_stub.trace = Usage(res)
+    app = App()
+    app.draw()  # 起動画面
+    for ms_id in range(len(app.monsters)):
+        app.battle_start(ms_id)
+        app.draw()
+    app.field_start()
+    app.menu_show()
+    app.draw()
+    app.game_over()
+    app.draw()
+    Window.close()
+    app.cur = None
+    app.rng.seed(seed)
+    app.new_game()
+    app.field_start()
+    bot = Bot(app, Navigator(app.terrain))
+    while not "end" in app.flags and app.frames < max_frames:
+        pyxel_stub.frame_count += 1
+        app.update(bot.act())
+        app.draw()
+    pyxel_stub.trace = None
+    if not "end" in app.flags:
+        sys.exit(f"seed {seed}: {max_frames} フレームでクリアできなかった")
+    return usage
+
+
+# main.py 中の px.play(ch, 定数) / self.play_bgm(定数) を記録に加える
+# （プレイで鳴らなかった音の分）
+def add_literal_sounds(usage, filename):
+    with open(filename, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename)
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not isinstance(node.func, ast.Attribute):
+            continue
+        args = [arg.value for arg in node.args if isinstance(arg, ast.Constant)]
+        if not all(isinstance(arg, int) for arg in args):
+            continue
+        if node.func.attr == "play" and len(args) == 2:
+            usage.append(("play", tuple(args)))
+        elif node.func.attr == "play_bgm" and len(args) == 1:
+            usage.append(("playm", (args[0],)))
+
+
+# 使っていない画素・タイルマップ・サウンド・ミュージックを空にしたリソース
+def prune(res, usage):
+    ret = {"format_version": res["format_version"]}
+    ret["images"] = []
+    for img, mask in zip(res["images"], usage.pixels):
+        width = img["width"]
+        rows = []
+        for y in range(img["height"]):
+            row = img["data"][y] if y < len(img["data"]) else []
+            used = mask[y * width : (y + 1) * width]
+            rows.append([c if used[x] else 0 for x, c in enumerate(row)])
+        ret["images"].append(dict(img, data=trim_rows(rows)))
+    used = {"tilemaps": usage.tilemaps, "sounds": usage.sounds, "musics": usage.musics}
+    for section in SECTIONS[1:]:
+        ret[section] = [
+            item if i in used[section] else dict(item, **EMPTY[section])
+            for i, item in enumerate(res[section])
+        ]
+    return ret
+
+
+# 行末の 0 と末尾の空行を省く（pyxel は省いた分を 0 として読む）
+def trim_rows(rows):
+    ret = []
+    for row in rows:
+        n = len(row)
+        while n > 1 and row[n - 1] == 0:
+            n -= 1
+        ret.append(row[:n] or [0])
+    while len(ret) > 1 and ret[-1] == [0]:
+        ret.pop()
+    return ret
+
+
+def load_resource(filename):
+    with zipfile.ZipFile(filename) as zf:
+        return tomllib.loads(zf.read(RESOURCE_TOML).decode())
+
+
+def dump_section_item(section, item):
+    lines = [f"[[{section}]]"]
+    lines += [f"{key} = {json.dumps(value)}" for key, value in item.items()]
+    return "\n".join(lines) + "\n"
+
+
+def dump_resource(res):
+    text = f"format_version = {res['format_version']}\n"
+    for section in SECTIONS:
+        for item in res[section]:
+            text += "\n" + dump_section_item(section, item)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        zf.writestr(RESOURCE_TOML, text)
+    return buf.getvalue()
+
+
+# main.py 冒頭の "# title: ..." などから pyxapp のコメントを作る（pyxel package と同じ形式）
+def metadata_comment(filename):
+    metadata = {}
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            match = METADATA_PATTERN.match(line)
+            if match and match.group(1).lower() in METADATA_FIELDS:
+                metadata[match.group(1).lower()] = match.group(2).strip()
+    if not metadata:
+        return ""
+    key_len = max(len(key) for key in metadata)
+    border = "-" * min(key_len + max(len(v) for v in metadata.values()) + 3, 80)
+    lines = [f"{key.ljust(key_len)} : {metadata[key]}" for key in metadata]
+    return "\n".join([border] + lines + [border])
+
+
+def write_pyxapp(filename, resource):
+    with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        zf.comment = metadata_comment(STARTUP_SCRIPT).encode()
+        zf.writestr(f"{APP_NAME}/{STARTUP_SCRIPT_FILE}", STARTUP_SCRIPT)
+        for name in FILES:
+            if name == RESOURCE_FILE:
+                zf.writestr(f"{APP_NAME}/{name}", resource)
+            else:
+                zf.write(name, f"{APP_NAME}/{name}")
+
+
+# pyxapp 内のファイル → 圧縮後のサイズ
+def entry_sizes(filename):
+    if not os.path.exists(filename):
+        return {}
+    with zipfile.ZipFile(filename) as zf:
+        return {
+            info.filename.split("/", 1)[-1]: info.compress_size
+            for info in zf.infolist()
+        }
+
+
+def compressed_size(text):
+    return len(zlib.compress(text.encode(), 9))
+
+
+def row(name, before, after):
+    print(f"  {name:24} {before:9,} {after:9,} {before - after:9,}")
+
+
+def report(res, pruned, sizes_before, sizes_after, usage):
+    print(f"  {'resource':24} {'before':>9} {'after':>9} {'saved':>9}")
+    for section in SECTIONS:
+        n = 0
+        for i, (item, new) in enumerate(zip(res[section], pruned[section])):
+            if item != new:
+                n += 1
+                row(
+                    f"{section}[{i}]",
+                    compressed_size(dump_section_item(section, item)),
+                    compressed_size(dump_section_item(section, new)),
+                )
+        if not n:
+            print(f"  {section}: 削れる項目なし")
+    print("  （リソースは項目ごとに単体で圧縮したサイズ）")
+    print(f"  使用中 tilemaps: {sorted(usage.tilemaps)}")
+    print(f"  使用中 sounds: {sorted(usage.sounds)}")
+    print(f"  使用中 musics: {sorted(usage.musics)}")
+    print()
+    print(f"  {'file':24} {'before':>9} {'after':>9} {'saved':>9}")
+    for name in sorted(set(sizes_before) | set(sizes_after)):
+        row(name, sizes_before.get(name, 0), sizes_after.get(name, 0))
+    row("total", sum(sizes_before.values()), sum(sizes_after.values()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="配布用 main.pyxapp の作成")
+    parser.add_argument("--out", default=os.path.join(ROOT, "main.pyxapp"))
+    parser.add_argument(
+        "--seed", type=int, default=0, help="ボットのプレイの乱数シード"
+    )
+    parser.add_argument("--max-frames", type=int, default=MAX_FRAMES)
+    args = parser.parse_args()
+    out = os.path.abspath(args.out)
+    os.chdir(ROOT)
+    res = load_resource(RESOURCE_FILE)
+    usage = trace(res, args.seed, args.max_frames)
+    add_literal_sounds(usage, STARTUP_SCRIPT)
+    pruned = prune(res, usage)
+    sizes_before = entry_sizes(out)
+    write_pyxapp(out, dump_resource(pruned))
+    report(res, pruned, sizes_before, entry_sizes(out), usage)
+    print(f"wrote {out} ({os.path.getsize(out):,} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# 入力まわりのチェック（入力ログを組み立てて tools/replay.py と同じく画面なしで再生）
+#
+#   python tools/check_input.py
+#
+# 押しっぱなしの連射（btnp の 10 フレーム後から 2 フレームごと）のような、手で再現
+# しにくい入力を確かめる。失敗したチェックがあれば終了コード 1。
+import os
+import sys
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+import pyxel_stub  # noqa: E402
+
+pyxel_stub.install()
+
+from input_log import InputLog  # noqa: E402
+from main import BTN_A, BTN_A_PRESS, BTN_RIGHT, BTN_TURBO, BTN_UP, Window  # noqa: E402
+from replay import replay  # noqa: E402
+
+
+# A を frames フレーム押しっぱなしにした入力（押した瞬間と、10 フレーム後から 2 フレームごと）
+def hold_a(frames):
+    return [
+        BTN_A | BTN_A_PRESS if i == 0 else BTN_A if i >= 10 and i % 2 == 0 else 0
+        for i in range(frames)
+    ]
+
+
+# ニューゲームを始めてフィールドに出るまでの入力
+def new_game():
+    return [BTN_A | BTN_A_PRESS] + [0] * 4
+
+
+# 自動移動で泉まで歩いて、泉のメッセージが出たところまでの入力
+def to_fountain():
+    return new_game() + [BTN_A | BTN_A_PRESS, 0, BTN_A | BTN_A_PRESS] + [0] * 300
+
+
+def play(frames):
+    log = InputLog(seed=0, saves=[None], frames=bytes(frames))
+    app, _ = replay(log)
+    return app
+
+
+# メッセージを A の押しっぱなしで閉じても、連射で行き先ウィンドウが開かない
+def check_hold_a_message():
+    base = play(to_fountain())
+    assert Window.all and base.cur is None, "no message at the fountain"
+    app = play(to_fountain() + hold_a(90))
+    assert not Window.all, list(Window.all)
+    assert app.cur is None, app.cur.key
+    assert app.autowalk is None, app.autowalk
+    assert (app.x, app.y, app.z) == (base.x, base.y, base.z)
+
+
+# A を押して開いた行き先ウィンドウは、押しっぱなしの連射では決定されない
+def check_hold_a_goto():
+    base = play(new_game())
+    app = play(new_game() + hold_a(90))
+    assert app.cur is not None and app.cur.key == "goto", app.cur
+    assert app.autowalk is None, app.autowalk
+    assert (app.x, app.y, app.z) == (base.x, base.y, base.z)
+
+
+# 早送り（3倍）で進めても、ゲーム時間は実際のフレーム数だけ進む
+def check_turbo_frames():
+    walk = [BTN_RIGHT] * 4 + [BTN_UP] * 4 + [0] * 8
+    base = play(new_game() + walk)
+    turbo = [b for btn in walk for b in (btn, btn | BTN_TURBO, btn | BTN_TURBO)]
+    app = play(new_game() + turbo)
+    # 同じ入力を早送りなしで進めたもの（ゲーム時間以外は同じになる）
+    slow = play(new_game() + [btn & ~BTN_TURBO for btn in turbo])
+    assert app.frames == base.frames, (app.frames, base.frames)
+    assert slow.frames > app.frames, (slow.frames, app.frames)
+    assert (app.x, app.y, app.z) == (slow.x, slow.y, slow.z)
+    assert (app.x, app.y, app.z) != (base.x, base.y, base.z)
+
+
+CHECKS = (check_hold_a_message, check_hold_a_goto, check_turbo_frames)
+
+
+def main():
+    os.chdir(ROOT)
+    failed = False
+    for check in CHECKS:
+        try:
+            check()
+            print(f"{check.__name__}: OK")
+        except AssertionError as e:
+            print(f"{check.__name__}: FAILED {e}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# 画面なしで動かすときの描画先（main.set_gfx / App(gfx=...) で使う）
+#
+# NullGfx は何も描かない（draw まで含めて最高速で回すとき）。RecordingGfx は画面への
+# 描画コマンドをタプルのリストにためる（tools/replay.py --render の描画の回帰テスト用）。
+import zlib
+
+
+# 何も描かない画像（NullGfx の image で作る）
+class NullImage:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def cls(self, col):
+        pass
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None):
+        pass
+
+    def rect(self, x, y, w, h, col):
+        pass
+
+    def text(self, x, y, s, col, font=None):
+        pass
+
+
+# 描画先: なし
+class NullGfx(NullImage):
+    image = NullImage
+
+    def __init__(self):
+        super().__init__(128, 128)
+
+    def bltm(self, x, y, tm, u, v, w, h, colkey=None):
+        pass
+
+    def line(self, x1, y1, x2, y2, col):
+        pass
+
+
+# 描画を記録する画像（RecordingGfx の image で作る）
+# 内容は描画コマンド列の CRC32 で表し、cls で数え直す
+class RecordedImage:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.crc = 0
+
+    def record(self, *cmd):
+        if cmd[0] == "cls":
+            self.crc = 0
+        self.crc = zlib.crc32(repr(cmd).encode(), self.crc)
+
+    # コマンドの引数に載せるときの形（画像に描いた内容が違えば違う値になる）
+    def ref(self):
+        return ("image", self.width, self.height, self.crc)
+
+    def cls(self, col):
+        self.record("cls", col)
+
+    def blt(self, x, y, img, u, v, w, h, colkey=None):
+        if isinstance(img, RecordedImage):
+            img = img.ref()
+        self.record("blt", x, y, img, u, v, w, h, colkey)
+
+    def rect(self, x, y, w, h, col):
+        self.record("rect", x, y, w, h, col)
+
+    def text(self, x, y, s, col, font=None):
+        self.record("text", x, y, s, col)
+
+
+# 描画先: 記録（1フレームごとに take で取り出す。前のフレームと同じ画面で描画を省いたら空）
+class RecordingGfx(RecordedImage):
+    image = RecordedImage
+
+    def __init__(self):
+        super().__init__(128, 128)
+        self.commands = []
+
+    def record(self, *cmd):
+        self.commands.append(cmd)
+
+    def bltm(self, x, y, tm, u, v, w, h, colkey=None):
+        self.record("bltm", x, y, tm, u, v, w, h, colkey)
+
+    def line(self, x1, y1, x2, y2, col):
+        self.record("line", x1, y1, x2, y2, col)
+
+    def take(self):
+        commands, self.commands = self.commands, []
+        return commands
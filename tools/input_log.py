@@ -0,0 +1,108 @@
+# 入力の記録と再生
+#
+# InputLog は乱数シード、読み込んだセーブデータ、1フレーム1バイトのボタン状態を持つ。
+# Recorder / Replayer は App に足して使う（class DevApp(Recorder, App) のように App より先に）。
+#   Recorder: 入力と読み込んだセーブデータを記録し、10秒ごとと終了時にファイルへ書き出す
+#   Replayer: セーブデータを記録から読み、セーブファイルは書かない（入力は play で渡す）
+import base64
+import json
+import random
+import zlib
+
+RECORD_INTERVAL = 300  # 書き出す間隔（フレーム）
+
+
+class InputLog:
+    VERSION = 6
+
+    def __init__(self, seed=None, saves=None, frames=b"", state=None):
+        self.seed = random.getrandbits(31) if seed is None else seed
+        self.saves = saves or []  # 読み込んだセーブデータ（save_dict 形式、読み込み順）
+        self.frames = bytearray(frames)
+        self.state = state  # 最後に書き出した時点のゲーム状態（セーブデータ形式）
+        self.save_pos = 0  # 再生時に次に読むセーブデータ
+
+    def dumps(self):
+        return json.dumps(
+            {
+                "version": self.VERSION,
+                "seed": self.seed,
+                "saves": self.saves,
+                "frames": len(self.frames),
+                "input": base64.b64encode(zlib.compress(self.frames, 9)).decode(),
+                "state": self.state,
+            }
+        )
+
+    @classmethod
+    def loads(cls, text):
+        data = json.loads(text)
+        if data["version"] != cls.VERSION:
+            raise ValueError(f"unsupported input log version {data['version']}")
+        frames = zlib.decompress(base64.b64decode(data["input"]))
+        return cls(data["seed"], data["saves"], frames, data["state"])
+
+    def write(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(self.dumps())
+
+    @classmethod
+    def read(cls, filename):
+        with open(filename, mode="r", encoding="utf-8") as f:
+            return cls.loads(f.read())
+
+
+# 記録する App（record: 書き出し先のファイル名）
+class Recorder:
+    def __init__(self, record, **kwargs):
+        self.record_file = record
+        self.input_log = InputLog()
+        super().__init__(seed=self.input_log.seed, **kwargs)
+
+    def read_input(self, tick=0):
+        btn = super().read_input(tick)
+        frames = self.input_log.frames
+        if frames and len(frames) % RECORD_INTERVAL == 0:
+            self.write_input_log()
+        frames.append(btn)
+        return btn
+
+    # 読んだセーブデータも記録する（読めなかったら None）
+    def read_save(self):
+        data = None
+        try:
+            data = super().read_save()
+        finally:
+            self.input_log.saves.append(data)
+        return data
+
+    # 入力ログを書き出す（ゲーム状態も添えて、再生結果の照合に使う）
+    def write_input_log(self):
+        self.input_log.state = self.save_dict()
+        try:
+            self.input_log.write(self.record_file)
+        except OSError:
+            pass
+
+    def quit(self):
+        self.write_input_log()
+        super().quit()
+
+
+# 記録を再生する App（replay: 再生する InputLog）
+class Replayer:
+    def __init__(self, replay, **kwargs):
+        self.input_log = replay
+        super().__init__(seed=replay.seed, **kwargs)
+
+    def read_save(self):
+        log = self.input_log
+        log.save_pos += 1
+        return log.saves[log.save_pos - 1]
+
+    def save_data(self):
+        pass
+
+    # 記録した1フレーム分の入力（get_btn_state と同じボタンのビット）で進める
+    def play(self, bits):
+        self.update(bits)
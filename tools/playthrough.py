@@ -0,0 +1,472 @@
+# 全編プレイのボットシミュレータ
+#
+# 画面なしの pyxel 代替（pyxel_stub）の上で App をボットのボタン入力で動かし、ニューゲームからクリアまでを
+# プロセスプールで並列に大量実行する。クリアまでのフレーム数、全滅回数、
+# クリア時の所持金の分布を出力する（バランス調整の検証用）。
+#
+# ボットは貪欲法：宝箱・扉・ボス・ショップ・泉のうち今の強さで行ける一番近い所へ
+# 階段をまたいだ距離表で向かい、行く所がなければ行ける一番深い階で戦って稼ぐ。
+#
+#   python tools/playthrough.py -n 1000              # 1000回プレイして分布を出力
+#   python tools/playthrough.py -n 200 --jobs 4 --csv runs.csv
+import argparse
+import csv
+import os
+import sys
+import time
+from array import array
+from multiprocessing import Pool
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+import pyxel_stub  # noqa: E402
+
+pyxel_stub.install()
+
+from main import (  # noqa: E402
+    BTN_A,
+    BTN_B,
+    BTN_DIRS,
+    BTN_DOWN,
+    BTN_LEFT,
+    BTN_RIGHT,
+    BTN_UP,
+    FLOORS,
+    SPELL_BURST,
+    SPELL_FIRE,
+    SPELL_HEAL,
+    SPELL_RETURN,
+    TERRAIN_DOWN,
+    TERRAIN_FOUNTAIN,
+    TERRAIN_UP,
+    UNREACHABLE,
+    App,
+    Window,
+)
+
+DIRS = ((0, -1, BTN_UP), (0, 1, BTN_DOWN), (-1, 0, BTN_LEFT), (1, 0, BTN_RIGHT))
+
+# 階ごとに必要な強さ（最大HP, ちから）。満たす一番深い階まで降りる
+FLOOR_POWER = ((0, 0), (30, 12), (45, 16), (70, 22), (110, 32))
+# ボス（話しかける障害物のキー）に挑む強さ（最大HP, 最大MP, ちから, はやさ）
+# この順に1体ずつ挑む
+BOSS_POWER = {
+    "2-5": (60, 0, 20, 0),
+    "3-1": (120, 0, 36, 30),
+    "4-3": (150, 50, 0, 0),
+}
+BOSS_FLAGS = {"2-5": "sp2", "3-1": "sp3", "4-3": "4-3"}
+# ショップで買う優先度（値段 × 重みが小さいものから。MPはバーストを覚えるまで高め）
+SHOP_WEIGHTS = (1.0, 2.0, 1.0, 1.2)
+SHOP_WEIGHTS_BURST = (1.0, 0.7, 1.0, 1.2)
+RETREAT = 0.4  # HPがこの割合を切ったら泉へもどる
+MAX_FRAMES = 30 * 60 * 120  # 打ち切り（ゲーム内2時間）
+
+
+# 階段をまたいだ距離表（全階を1つの配列にし、行き先から逆向きに幅優先探索）
+class Navigator:
+    def __init__(self, terrain):
+        self.w = terrain.width
+        self.size = terrain.width * terrain.height
+        self.grids = terrain.grids
+        self.cache = {}
+        # 泉と階ごとの階段のマス
+        self.fountains = self.cells(TERRAIN_FOUNTAIN)
+        stairs = self.cells(TERRAIN_UP) + self.cells(TERRAIN_DOWN)
+        self.stairs = [
+            [i for i in stairs if i // self.size == z] for z in range(FLOORS)
+        ]
+
+    def cells(self, terrain):
+        return [
+            z * self.size + i
+            for z, grid in enumerate(self.grids)
+            for i, t in enumerate(grid)
+            if t == terrain
+        ]
+
+    def index(self, x, y, z):
+        return z * self.size + y * self.w + x
+
+    # name と障害物の状態（フラグ）が同じなら作った表を使い回す
+    def field(self, name, state, sources, blocked):
+        key = (name, state)
+        dist = self.cache.get(key)
+        if dist is None:
+            if len(self.cache) >= 256:
+                self.cache.clear()
+            dist = self.cache[key] = self.build(sources, blocked)
+        return dist
+
+    # 立っているマス i に1歩で来られるマスをたどる
+    # 上り階段の上にいる＝1つ上の階の下り階段から来た（下り階段も同様）
+    def build(self, sources, blocked):
+        w, size, grids = self.w, self.size, self.grids
+        dist = array("H", [UNREACHABLE]) * (size * len(grids))
+        queue = list(sources)
+        for i in queue:
+            dist[i] = 0
+        for i in queue:
+            d = dist[i] + 1
+            z, j = divmod(i, size)
+            terrain = grids[z][j]
+            if terrain == TERRAIN_UP:
+                z -= 1
+            elif terrain == TERRAIN_DOWN:
+                z += 1
+            if not 0 <= z < len(grids):
+                continue
+            grid = grids[z]
+            # 上下左右のうち階の中のマスだけ（外は壁。左右の端で隣の行に回り込まない）
+            x = j % w
+            near = [k for k in (j - w, j + w) if 0 <= k < size]
+            if x > 0:
+                near.append(j - 1)
+            if x < w - 1:
+                near.append(j + 1)
+            for k in near:
+                p = z * size + k
+                if dist[p] != UNREACHABLE:
+                    continue
+                terrain = grid[k]
+                if terrain in (TERRAIN_UP, TERRAIN_DOWN) or (
+                    not terrain and p not in blocked
+                ):
+                    dist[p] = d
+                    queue.append(p)
+        return dist
+
+
+# 貪欲法のボット（毎フレーム App の状態を見てボタンのビット列を返す）
+class Bot:
+    def __init__(self, app, nav):
+        self.app = app
+        self.nav = nav
+        self.grind_dir = 0
+
+    def act(self):
+        app = self.app
+        if app.cur:
+            bits = self.cursor(app.cur)
+        elif app.scene in ("battle", "gameover"):
+            return BTN_A
+        elif app.scene != "field" or app.moving:
+            return 0
+        else:
+            bits = self.walk()
+        # メッセージ直後は十字キーを一度離さないと受け付けない
+        return 0 if app.wait and bits & BTN_DIRS else bits
+
+    ### カーソル ###
+
+    # pos を選んで決定（カーソルは押すたびに1つ動くので、離すフレームをはさむ）
+    def select(self, cur, pos):
+        if cur.pos == pos:
+            return BTN_A
+        if cur.moved:
+            return 0
+        n = len(cur.list_x)
+        return BTN_RIGHT if (pos - cur.pos) % n <= n // 2 else BTN_LEFT
+
+    def cursor(self, cur):
+        app = self.app
+        if cur.key == "menu":
+            return self.select(cur, 1) if self.can_return() else BTN_B
+        if cur.key == "spells":
+            spells = app.available_spells()
+            if SPELL_RETURN in spells and self.can_return():
+                return self.select(cur, spells.index(SPELL_RETURN))
+            return BTN_B
+        if cur.key == "shop":
+            item = self.shop_item()
+            return BTN_B if item is None else self.select(cur, item)
+        if cur.key in ("boss1", "boss2", "boss3"):
+            return self.select(cur, 0)
+        if cur.key == "bt_command":
+            spell = self.battle_spell()
+            if spell is None:
+                return self.select(cur, 2 if self.should_run() else 0)
+            return self.select(cur, 1)
+        if cur.key == "bt_spells":
+            spell = self.battle_spell()
+            if spell is None:
+                return BTN_B
+            return self.select(cur, app.available_spells(True).index(spell))
+        return BTN_B
+
+    ### 戦闘 ###
+
+    # 使う呪文（使わないなら None）
+    def battle_spell(self):
+        app = self.app
+        pl, ms = app.pl, app.ms
+        spells = app.available_spells(True)
+        if (
+            SPELL_BURST in spells
+            and pl.mp
+            and (app.bt_evt == "boss3" or pl.mp * 8 >= ms.hp > pl.atk)
+        ):
+            return SPELL_BURST
+        if SPELL_HEAL in spells and pl.hp * 3 < pl.mhp and ms.hp > pl.atk:
+            if app.spells[SPELL_HEAL].get_mp(pl) * 5 >= ms.atk:
+                return SPELL_HEAL
+        fire = app.spells[SPELL_FIRE]
+        if not ms.resist and pl.mp >= fire.mp and ms.hp > pl.atk and pl.atk < 24:
+            return SPELL_FIRE
+        return None
+
+    # ボス以外で、次の一撃で倒されそうなら逃げる
+    def should_run(self):
+        app = self.app
+        return app.bt_evt is None and app.pl.hp <= app.ms.atk
+
+    ### ショップ ###
+
+    # 買う項目（買わないなら None）
+    def shop_item(self):
+        app = self.app
+        weights = SHOP_WEIGHTS_BURST if "sp3" in app.flags else SHOP_WEIGHTS
+        best = None
+        for kind, weight in enumerate(weights):
+            _, _, cost = app.shop_get_item(kind)
+            if cost and cost <= app.gold:
+                if best is None or cost * weight < best[0]:
+                    best = (cost * weight, kind)
+        return best and best[1]
+
+    def shop_cost(self):
+        costs = [self.app.shop_get_item(kind)[2] for kind in range(4)]
+        return min((cost for cost in costs if cost), default=None)
+
+    ### フィールド ###
+
+    def can_return(self):
+        app = self.app
+        return (
+            app.z > 0
+            and "sp1" in app.flags
+            and app.pl.mp >= app.spells[SPELL_RETURN].mp
+            and app.pl.hp < app.pl.mhp * RETREAT
+        )
+
+    def power_ok(self, power):
+        pl = self.app.pl
+        return all(a >= b for a, b in zip((pl.mhp, pl.mmp, pl.atk, pl.spd), power))
+
+    # 今の強さで行ける一番深い階
+    def safe_floor(self):
+        return max(
+            z for z, (hp, atk) in enumerate(FLOOR_POWER) if self.power_ok((hp, 0, atk))
+        )
+
+    # 行き先を決めて1歩ぶんのボタンを返す
+    def walk(self):
+        app = self.app
+        if self.can_return():
+            return BTN_B  # メニューからリターン
+        here = self.nav.index(app.x, app.y, app.z)
+        for name, sources in self.goals():
+            if sources is None:
+                break  # 目的の階にいる
+            dist = self.nav.field(name, bytes(app.flags.bits), sources, self.blocked())
+            if dist[here] != UNREACHABLE:
+                return self.step(dist, here)
+        return self.grind()
+
+    # 行き先の候補（名前, 始点のリスト）を優先度順に
+    def goals(self):
+        app = self.app
+        pl = app.pl
+        obs = app.obstacles
+        if "4-3" in app.flags:
+            yield self.floor_goal(0)
+            return
+        if pl.hp < pl.mhp * RETREAT:
+            yield ("fountain", self.nav.fountains)
+        cost = self.shop_cost()
+        if cost and app.gold >= cost * (1 if app.z == 0 else 2):
+            yield ("shop", self.keys_at(["0-3"]))
+        safe = self.safe_floor()
+        boss = next(
+            (key for key in BOSS_POWER if not BOSS_FLAGS[key] in app.flags), None
+        )
+        keys = []
+        for i, key in enumerate(obs.keys):
+            if not obs.alive[i] or obs.z[i] > safe:
+                continue
+            if obs.kind[i] == 1 or (obs.kind[i] == 0 and app.keys):
+                keys.append(key)
+            elif key == boss and self.power_ok(BOSS_POWER[key]):
+                keys.append(key)
+        if "1-2" not in keys and not "sp1" in app.flags:
+            keys.append("1-2")  # リターンを教えてくれる人
+        if keys:
+            yield ("targets " + " ".join(keys), self.keys_at(keys))
+        if pl.hp < pl.mhp:
+            yield ("fountain", self.nav.fountains)
+        yield self.floor_goal(max(safe, 1))
+
+    def keys_at(self, keys):
+        obs = self.app.obstacles
+        rows = (obs.rows[key] for key in keys)
+        return [self.nav.index(obs.x[i], obs.y[i], obs.z[i]) for i in rows]
+
+    # z 階へ行く（その階の階段に着けばよい。すでにその階なら始点なし）
+    def floor_goal(self, z):
+        return (f"floor{z}", None if self.app.z == z else self.nav.stairs[z])
+
+    def blocked(self):
+        obs = self.app.obstacles
+        return {self.nav.index(x, y, z) for x, y, z in obs.at}
+
+    # 距離が小さくなる方向へ1歩
+    def step(self, dist, here):
+        app = self.app
+        nav = self.nav
+        for dx, dy, bit in DIRS:
+            x, y = app.x + dx, app.y + dy
+            terrain = app.terrain.get(x, y, app.z)
+            z = app.z - (terrain == TERRAIN_UP) + (terrain == TERRAIN_DOWN)
+            if dist[nav.index(x, y, z)] < dist[here]:
+                return bit
+        return 0
+
+    # 稼ぎ：床の上を往復してエンカウントを待つ
+    def grind(self):
+        app = self.app
+        for turn in range(4):
+            dx, dy, bit = DIRS[(self.grind_dir + turn) % 4]
+            x, y = app.x + dx, app.y + dy
+            if not app.terrain.get(x, y, app.z) and not app.obstacles.key_at(
+                x, y, app.z
+            ):
+                self.grind_dir = (self.grind_dir + turn) % 4
+                return bit
+        return 0
+
+
+# セーブファイルを書かない App
+class BotApp(App):
+    def save_data(self):
+        pass
+
+
+# ワーカープロセスごとに App を1つ作って使い回す
+app = None
+nav = None
+
+
+def init_worker():
+    global app, nav
+    os.chdir(ROOT)
+    app = BotApp()
+    nav = Navigator(app.terrain)
+
+
+# 1回プレイ（ニューゲームからクリアまたは打ち切りまで）
+def play(seed, max_frames=MAX_FRAMES):
+    Window.close()
+    app.cur = None
+    app.rng.seed(seed)
+    app.new_game()
+    app.field_start()
+    bot = Bot(app, nav)
+    deaths = battles = 0
+    scene = app.scene
+    while not "end" in app.flags and app.frames < max_frames:
+        app.update(bot.act())
+        if app.scene != scene:
+            scene = app.scene
+            deaths += scene == "gameover"
+            battles += scene == "battle"
+    pl = app.pl
+    return {
+        "seed": seed,
+        "cleared": int("end" in app.flags),
+        "frames": app.frames,
+        "deaths": deaths,
+        "battles": battles,
+        "gold": app.gold,
+        "mhp": pl.mhp,
+        "mmp": pl.mmp,
+        "atk": pl.atk,
+        "spd": pl.spd,
+    }
+
+
+def play_args(args):
+    return play(*args)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def clock(frames):
+    s = frames // 30
+    return f"{s // 60}:{s % 60:02}"
+
+
+def report(results, elapsed):
+    n = len(results)
+    cleared = [r for r in results if r["cleared"]]
+    print(
+        f"runs={n} cleared={len(cleared) / n:.1%} "
+        f"({elapsed:.1f}s, {n / elapsed * 60:,.0f} runs/min)"
+    )
+    if not cleared:
+        return
+    for key in ("frames", "deaths", "battles", "gold"):
+        values = [r[key] for r in cleared]
+        mean = sum(values) / len(values)
+        fmt = clock if key == "frames" else str
+        mean = clock(int(mean)) if key == "frames" else f"{mean:.2f}"
+        print(
+            f"  {key:8} mean {mean:>7}"
+            + "".join(
+                f"  p{int(p * 100)} {fmt(percentile(values, p)):>7}"
+                for p in (0.1, 0.5, 0.9)
+            )
+            + f"  max {fmt(max(values)):>7}"
+        )
+    hist = {}
+    for r in cleared:
+        d = min(r["deaths"], 5)
+        hist[d] = hist.get(d, 0) + 1
+    print(
+        "  deaths   ratio "
+        + "  ".join(
+            f"{d if d < 5 else '5+'}:{hist.get(d, 0) / len(cleared):.0%}"
+            for d in range(6)
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全編プレイのボットシミュレータ")
+    parser.add_argument("-n", type=int, default=100, help="プレイ回数")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="プロセス数")
+    parser.add_argument("--seed", type=int, default=0, help="最初の乱数シード")
+    parser.add_argument("--max-frames", type=int, default=MAX_FRAMES)
+    parser.add_argument("--csv", help="1回ごとの結果の書き出し先")
+    args = parser.parse_args()
+    tasks = [(args.seed + i, args.max_frames) for i in range(args.n)]
+    start = time.perf_counter()
+    with Pool(args.jobs, initializer=init_worker) as pool:
+        results = list(pool.imap_unordered(play_args, tasks, chunksize=4))
+    elapsed = time.perf_counter() - start
+    results.sort(key=lambda r: r["seed"])
+    report(results, elapsed)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
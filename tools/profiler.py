@@ -0,0 +1,173 @@
+# フレーム時間プロファイラ（tools/run.py --profile）
+#
+# update、draw と、update 内の選択肢・シーンごとの処理（handler）、draw 内のウィンドウ・
+# 障害物の描画時間を計測する。F1キーでオン・オフし、オンの間は直近128フレームの
+# update + draw の時間のグラフを30fpsの1フレーム分の線と最も遅いフレームの線と一緒に
+# 画面に重ね、csv を指定するとフレームごとの計測値（とそのフレームで呼ばれた処理の名前）を
+# 書き出す。
+# Profiling は App に足して使う（class DevApp(Profiling, App) のように App より先に）。
+import time
+from array import array
+
+import pyxel as px
+
+import main
+from main import ObstacleTable, Window
+
+
+class Profiler:
+    SECTIONS = ("update", "draw", "handler", "windows", "obstacles")
+    COLORS = (8, 12, 9, 11, 10)
+    LENGTH = 128  # グラフに表示するフレーム数
+    SCALE = 2  # グラフの縦方向（1ミリ秒あたりのドット数）
+
+    def __init__(self, csv_file=None):
+        self.enabled = False
+        self.csv_file = csv_file
+        self.csv = None
+        self.times = dict.fromkeys(self.SECTIONS, 0.0)  # 今のフレームの計測値（秒）
+        self.starts = {}
+        self.handler = ""  # 今のフレームで呼ばれた処理の名前
+        self.history = [array("f", bytes(4 * self.LENGTH)) for _ in self.SECTIONS]
+        self.frame = 0
+        self.worst = 0.0  # グラフ内で最も遅いフレームの時間（ミリ秒）
+        self.worst_frame = 0
+
+    # 計測のオン・オフ（csv_file があればオンの間フレームごとの計測値を書き出す）
+    def toggle(self):
+        self.enabled = not self.enabled
+        if self.enabled and self.csv_file:
+            try:
+                self.csv = open(self.csv_file, "w", encoding="utf-8")
+                names = ",".join(f"{name}_ms" for name in self.SECTIONS)
+                self.csv.write(f"frame,scene,handler,{names}\n")
+            except OSError:
+                self.csv = None
+        elif not self.enabled:
+            self.close()
+
+    # csv を閉じる（書きかけの行も書き出す）
+    def close(self):
+        if self.csv:
+            self.csv.close()
+            self.csv = None
+
+    # name の計測開始（label があれば呼ばれた処理の名前として記録）
+    def begin(self, name, label=None):
+        if self.enabled:
+            self.starts[name] = time.perf_counter()
+            if label:
+                self.handler = label
+
+    def end(self, name):
+        if self.enabled:
+            self.times[name] += time.perf_counter() - self.starts[name]
+
+    # 1フレーム分の計測を確定
+    def commit(self, scene):
+        if not self.enabled:
+            return
+        pos = self.frame % self.LENGTH
+        ms = [self.times[name] * 1000 for name in self.SECTIONS]
+        for history, value in zip(self.history, ms):
+            history[pos] = value
+        total = ms[0] + ms[1]
+        if total >= self.worst:
+            self.worst, self.worst_frame = total, self.frame
+        elif self.worst_frame <= self.frame - self.LENGTH:
+            # 最も遅いフレームがグラフから外れたら探し直す
+            totals = [u + d for u, d in zip(self.history[0], self.history[1])]
+            self.worst = max(totals)
+            i = totals.index(self.worst)
+            self.worst_frame = self.frame - (pos - i) % self.LENGTH
+        if self.csv:
+            values = ",".join(f"{v:.3f}" for v in ms)
+            self.csv.write(f"{self.frame},{scene},{self.handler},{values}")
+            self.csv.write("\n")
+            if self.frame % 30 == 0:
+                self.csv.flush()
+        self.times = dict.fromkeys(self.SECTIONS, 0.0)
+        self.handler = ""
+        self.frame += 1
+
+    # 計測結果をグラフで重ねて表示（update と draw の積み上げ、白線は30fpsの1フレーム）
+    def draw(self):
+        if not self.enabled:
+            return
+        gfx = main.GFX  # 描画先（App で set_gfx したもの）
+        start = self.frame - self.LENGTH
+        for x in range(self.LENGTH):
+            if start + x < 0:
+                continue
+            pos = (start + x) % self.LENGTH
+            y = 127
+            for i in range(2):
+                h = self.history[i][pos] * self.SCALE
+                if h >= 1:
+                    gfx.line(x, y, x, y - h + 1, self.COLORS[i])
+                    y -= h
+        budget = 127 - 1000 / 30 * self.SCALE
+        gfx.line(0, budget, 127, budget, 7)
+        if start < self.worst_frame:
+            gfx.line(self.worst_frame - start, 0, self.worst_frame - start, 127, 9)
+        pos = (self.frame - 1) % self.LENGTH
+        items = zip(self.SECTIONS, self.history)
+        t = " ".join(f"{name[0].upper()}{h[pos]:.1f}" for name, h in items)
+        gfx.rect(0, 0, 128, 7, 0)
+        gfx.text(1, 1, f"{t} MAX{self.worst:.1f}", 7)
+
+
+# 関数の実行時間を section に足す
+def timed(profiler, section, func):
+    def wrapper(*args):
+        profiler.begin(section)
+        ret = func(*args)
+        profiler.end(section)
+        return ret
+
+    return wrapper
+
+
+# プロファイラ付きの App（profile: 起動時からオン、profile_csv: 計測値の書き出し先）
+class Profiling:
+    def __init__(self, profile=False, profile_csv=None, **kwargs):
+        self.profiler = Profiler(profile_csv)
+        if profile:
+            self.profiler.toggle()
+        Window.draw = timed(self.profiler, "windows", Window.draw)
+        ObstacleTable.draw = timed(self.profiler, "obstacles", ObstacleTable.draw)
+        super().__init__(**kwargs)
+
+    # 1フレームの更新（F1キーでプロファイラを切り替え）
+    def run_update(self):
+        if px.btnp(px.KEY_F1):
+            self.profiler.toggle()
+        super().run_update()
+
+    # update の時間を計る（早送り中は1フレーム分の合計）
+    def update(self, btn=None):
+        self.profiler.begin("update")
+        super().update(btn)
+        self.profiler.end("update")
+
+    # 選択肢・シーンごとの処理（処理ごとの時間を計る）
+    def dispatch(self, handlers, key, *args):
+        self.profiler.begin("handler", handlers[key].__name__)
+        super().dispatch(handlers, key, *args)
+        self.profiler.end("handler")
+
+    # グラフが毎フレーム変わるので、有効な間は常に描き直す
+    def screen_state(self):
+        return None if self.profiler.enabled else super().screen_state()
+
+    # 1フレームの描画（プロファイラが有効ならグラフを重ねる）
+    def draw(self):
+        self.profiler.begin("draw")
+        super().draw()
+        self.profiler.end("draw")
+        self.profiler.commit(self.scene)
+        self.profiler.draw()
+
+    def quit(self):
+        self.profiler.close()
+        super().quit()
@@ -0,0 +1,193 @@
+# 画面なしで main を動かすための pyxel 代替モジュール（リプレイ、ベンチマーク用）
+#
+# init / run は何もせず、描画はせずに blt / bltm / text / rect などの呼び出し回数だけを
+# 数える（画面への描画は "blt"、画像への描画は "Image.blt"）。load はリソースファイルの
+# タイルマップだけを読む。trace にリストを入れておくと、画像・タイルマップ・音を使う
+# 呼び出しを引数ごと記録する。main を import する前に sys.modules["pyxel"] に差し込んで使う:
+#
+#   import pyxel_stub
+#   pyxel_stub.install()
+#   import main
+import random
+import sys
+import tempfile
+import zipfile
+from collections import Counter
+
+counts = Counter()  # 呼び出し回数
+trace = None  # (呼び出し名, 引数) のリスト（None なら記録しない）
+frame_count = 0
+tilemaps = []
+_rnd = random.Random(0)
+_data_dir = tempfile.mkdtemp(prefix="pyxel_stub_")
+
+KEY_NONE = 0
+KEY_UP = 1
+KEY_DOWN = 2
+KEY_LEFT = 3
+KEY_RIGHT = 4
+KEY_Z = 5
+KEY_X = 6
+KEY_F1 = 7
+KEY_F2 = 8
+KEY_F3 = 9
+GAMEPAD1_BUTTON_DPAD_UP = 11
+GAMEPAD1_BUTTON_DPAD_DOWN = 12
+GAMEPAD1_BUTTON_DPAD_LEFT = 13
+GAMEPAD1_BUTTON_DPAD_RIGHT = 14
+GAMEPAD1_BUTTON_A = 15
+GAMEPAD1_BUTTON_B = 16
+GAMEPAD1_BUTTON_X = 17
+GAMEPAD1_BUTTON_Y = 18
+
+
+def install():
+    sys.modules["pyxel"] = sys.modules[__name__]
+
+
+def reset_counts():
+    counts.clear()
+
+
+def _trace(name, args):
+    counts[name] += 1
+    if trace is not None:
+        trace.append((name, args))
+
+
+### システム ###
+
+
+def init(width, height, **kwargs):
+    counts["init"] += 1
+
+
+def run(update, draw):
+    counts["run"] += 1
+
+
+def quit():
+    counts["quit"] += 1
+
+
+def user_data_dir(vendor, app):
+    return _data_dir + "/"
+
+
+def load(filename):
+    import tomllib
+
+    with zipfile.ZipFile(filename) as zf:
+        res = tomllib.loads(zf.read("pyxel_resource.toml").decode())
+    tilemaps[:] = [Tilemap(tm) for tm in res["tilemaps"]]
+
+
+### 入力 ###
+
+
+def btn(key):
+    return False
+
+
+def btnp(key, hold=None, repeat=None):
+    return False
+
+
+### 描画 ###
+
+
+class Font:
+    def __init__(self, filename):
+        self.filename = filename
+
+
+class Image:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    def cls(self, col):
+        counts["Image.cls"] += 1
+
+    def blt(self, *args):
+        _trace("Image.blt", args)
+
+    def rect(self, *args):
+        counts["Image.rect"] += 1
+
+    def text(self, *args):
+        counts["Image.text"] += 1
+
+    def pset(self, *args):
+        counts["Image.pset"] += 1
+
+
+class Tilemap:
+    def __init__(self, data):
+        self.width = data["width"]
+        self.height = data["height"]
+        self.rows = data["data"]  # 行ごとに u, v を並べたもの（末尾の0は省略）
+
+    def pget(self, x, y):
+        row = self.rows[y] if y < len(self.rows) else []
+        u = row[x * 2] if x * 2 < len(row) else 0
+        v = row[x * 2 + 1] if x * 2 + 1 < len(row) else 0
+        return (u, v)
+
+
+def cls(col):
+    counts["cls"] += 1
+
+
+def blt(*args):
+    _trace("blt", args)
+
+
+def bltm(*args):
+    _trace("bltm", args)
+
+
+def text(*args):
+    counts["text"] += 1
+
+
+def rect(*args):
+    counts["rect"] += 1
+
+
+def rectb(*args):
+    counts["rectb"] += 1
+
+
+def line(*args):
+    counts["line"] += 1
+
+
+def pset(*args):
+    counts["pset"] += 1
+
+
+### 音 ###
+
+
+def play(ch, snd, **kwargs):
+    _trace("play", (ch, snd))
+
+
+def playm(msc, **kwargs):
+    _trace("playm", (msc,))
+
+
+### 乱数 ###
+
+
+def rseed(seed):
+    _rnd.seed(seed)
+
+
+def rndi(a, b):
+    return _rnd.randint(a, b)
+
+
+def rndf(a, b):
+    return _rnd.uniform(a, b)
@@ -0,0 +1,130 @@
+# 入力ログの高速リプレイ（画面なし）
+#
+#   python tools/run.py --record run.json   # プレイを記録
+#   python tools/replay.py run.json         # 再生して記録時の状態と照合
+#
+# pyxel_stub の上で、記録時の乱数シードと読み込んだセーブデータを使って App.update に
+# 入力をそのまま流し込むので、同じ結果になる。回帰テストの入力や、性能測定の
+# 再現可能な負荷として使う。
+#
+#   python tools/replay.py run.json --draw                 # draw も回す（NullGfx）
+#   python tools/replay.py run.json --render run.render    # 描画の回帰テスト
+#
+# --render では RecordingGfx で毎フレームの描画コマンドを記録し、フレームごとの
+# CRC32 をファイルと比べる（ファイルがなければ作る）。違ったら最初のフレームの
+# コマンドを出力する。
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+import pyxel_stub  # noqa: E402
+
+pyxel_stub.install()
+
+from gfx import NullGfx, RecordingGfx  # noqa: E402
+from input_log import InputLog, Replayer  # noqa: E402
+from main import App, Window  # noqa: E402
+
+
+class ReplayApp(Replayer, App):
+    pass
+
+
+# ログを最後まで再生し、App と再生時間を返す（gfx を指定すると毎フレーム draw も呼ぶ）
+def replay(log, gfx=None):
+    Window.close()
+    app = ReplayApp(replay=log, gfx=gfx)
+    start = time.perf_counter()
+    for bits in log.frames:
+        app.play(bits)
+        if gfx:
+            app.draw()
+    return app, time.perf_counter() - start
+
+
+# 描画を記録しながら再生し、フレームごとの描画コマンドを返す（描画を省いたフレームは空）
+def record_frames(log):
+    Window.close()
+    gfx = RecordingGfx()
+    app = ReplayApp(replay=log, gfx=gfx)
+    frames = []
+    for bits in log.frames:
+        app.play(bits)
+        app.draw()
+        frames.append(gfx.take())
+    return frames
+
+
+def digest(commands):
+    return zlib.crc32(repr(commands).encode())
+
+
+# 記録したフレームごとの CRC32 と比べる（ファイルがなければ書き出す）。一致したら True
+def check_render(log, filename):
+    frames = record_frames(log)
+    digests = [digest(commands) for commands in frames]
+    if not os.path.exists(filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(digests, f)
+        print(f"  wrote {filename} ({len(digests)} frames)")
+        return True
+    with open(filename, encoding="utf-8") as f:
+        expected = json.load(f)
+    for i, (now, base) in enumerate(zip(digests, expected)):
+        if now != base:
+            print(f"  render: frame {i} differs")
+            for cmd in frames[i]:
+                print(f"    {cmd}")
+            return False
+    if len(digests) != len(expected):
+        print(f"  render: {len(digests)} frames, recorded {len(expected)}")
+        return False
+    print(f"  render: {len(digests)} frames OK")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入力ログのリプレイ")
+    parser.add_argument("logs", nargs="+", help="tools/run.py --record で記録したファイル")
+    parser.add_argument("--repeat", type=int, default=1, help="繰り返し回数")
+    parser.add_argument("--draw", action="store_true", help="draw も回す（描画なし）")
+    parser.add_argument("--render", help="描画の回帰テストのファイル（ログ1つのとき）")
+    args = parser.parse_args()
+    if args.render and len(args.logs) > 1:
+        parser.error("--render はログ1つのときだけ使える")
+    os.chdir(ROOT)
+    failed = False
+    for filename in args.logs:
+        log = InputLog.read(filename)
+        for _ in range(args.repeat):
+            gfx = NullGfx() if args.draw else None
+            app, elapsed = replay(InputLog.loads(log.dumps()), gfx)
+        state = app.save_dict()
+        ok = log.state is None or state == log.state
+        failed |= not ok
+        print(
+            f"{filename}: {len(log.frames)} frames in {elapsed * 1000:.1f}ms"
+            f" ({len(log.frames) / max(elapsed, 1e-9):,.0f} frames/s)"
+            f" {'OK' if ok else 'MISMATCH'}"
+        )
+        if not ok:
+            for key in state:
+                if state[key] != log.state.get(key):
+                    print(
+                        f"  {key}: recorded={log.state.get(key)} replayed={state[key]}"
+                    )
+        if args.render:
+            failed |= not check_render(InputLog.loads(log.dumps()), args.render)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
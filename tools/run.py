@@ -0,0 +1,44 @@
+# 開発用の機能を付けてゲームを起動する
+#
+#   python tools/run.py --record run.json   # プレイの入力を記録（tools/replay.py で再生）
+#   python tools/run.py --profile           # フレーム時間プロファイラをオンで起動（F1で切り替え）
+#   python tools/run.py --battles battles.bin  # バトルを記録（tools/battle_report.py で集計）
+import argparse
+import os
+import sys
+
+TOOLS = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(TOOLS, "..")
+sys.path.insert(0, TOOLS)
+sys.path.insert(0, ROOT)
+
+from battle_log import BattleLogging  # noqa: E402
+from input_log import Recorder  # noqa: E402
+from main import App  # noqa: E402
+from profiler import Profiling  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="開発用の機能を付けてゲームを起動")
+    parser.add_argument("--record", help="入力ログの書き出し先")
+    parser.add_argument("--profile", action="store_true", help="プロファイラをオンで起動")
+    parser.add_argument("--profile-csv", help="プロファイラの計測値の書き出し先")
+    parser.add_argument("--battles", help="バトルの記録の書き出し先")
+    args = parser.parse_args()
+    record = args.record and os.path.abspath(args.record)
+    csv_file = args.profile_csv and os.path.abspath(args.profile_csv)
+    battles = args.battles and os.path.abspath(args.battles)
+    os.chdir(ROOT)
+    bases = (Profiling, App)
+    kwargs = {"profile": args.profile, "profile_csv": csv_file}
+    if record:
+        bases = (Recorder,) + bases
+        kwargs["record"] = record
+    if battles:
+        bases = (BattleLogging,) + bases
+        kwargs["battles"] = battles
+    type("DevApp", bases, {})(**kwargs)
+
+
+if __name__ == "__main__":
+    main()